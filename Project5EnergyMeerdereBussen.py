@@ -1,27 +1,30 @@
 import pandas as pd
 
+from combined8 import DEFAULT_VEHICLE
 
-def set_energy_variables():
+
+def set_energy_variables(vehicle=DEFAULT_VEHICLE):
 
     """
     Sets the SOH and the minimum and maximum battery level to the desired amount
+    param vehicle: the VehicleModel of the bus
     Returns the minimum and maximun battery level
 
     """
     
-    soh = 255  # kWh
-    min_battery_level = 0.10 * soh  # 25.5 kWh
-    max_battery_level = 0.90 * soh   # 239.5 kWh
+    min_battery_level = vehicle.min_level * vehicle.soh  # 25.5 kWh for the standard bus
+    max_battery_level = vehicle.max_level * vehicle.soh   # 229.5 kWh for the standard bus
 
 
     return( min_battery_level, max_battery_level)
 
 
-def check_feasible_per_route(min_battery_level, max_battery_level, group_bus):
+def check_feasible_per_route(min_battery_level, max_battery_level, group_bus, idle_power=DEFAULT_VEHICLE.idle_power):
     """
     Checks if each route is feasible in terms of energy levels
     param min_battery_level: the minimum amount of battery that has to be available in the bus
     param max_battery_level: the maximum amount of battery the bus can be
+    param idle_power: the energy use while idle in kW
     return: the feasibility of each route plus the energy consumed on all busroutes
 
     """
@@ -42,12 +45,12 @@ def check_feasible_per_route(min_battery_level, max_battery_level, group_bus):
                 start_time = pd.to_datetime(route["start time"])
                 end_time = pd.to_datetime(route["end time"])
                 idle_time_hours = (end_time - start_time).total_seconds() / 3600  
-                energy_consumption = 5 * max(0, idle_time_hours)  
+                energy_consumption = idle_power * max(0, idle_time_hours)  
 
 
 
             if current_battery_level - energy_consumption < min_battery_level:
-                print(f"Bus {bus_id}: Battery level will drop below 10% during route {route_index+1}. Route is infeasible.")
+                print(f"Bus {bus_id}: Battery level will drop below the minimum during route {route_index+1}. Route is infeasible.")
                 feasible = False
                 break
 
@@ -73,8 +76,9 @@ def main():
     
     df = pd.read_excel("Bus Planning-1.xlsx")
     group_bus = df.groupby('bus')
-    min_battery_level,max_battery_level = set_energy_variables()
-    total_energy_used = check_feasible_per_route(min_battery_level, max_battery_level, group_bus)
+    vehicle = DEFAULT_VEHICLE
+    min_battery_level,max_battery_level = set_energy_variables(vehicle)
+    total_energy_used = check_feasible_per_route(min_battery_level, max_battery_level, group_bus, vehicle.idle_power)
     print(f"Total Energy Used for Bus Plan is: {total_energy_used}")
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+"""
+Times every step of the bus plan pipeline on synthetic plans of different fleet sizes
+
+Example:
+    python benchmark.py --sizes 10 100 1000 10000 --output benchmark_results.json
+    python benchmark.py --compare benchmark_results.json --output new_results.json
+    python benchmark.py --sizes 1000 --days 30 --max-excel-buses 0 --output month.json
+
+Every step is timed (best of --repeat runs) and run once more under tracemalloc for the peak memory.
+With --compare the results are compared to an earlier run, a step that became more than
+--threshold slower is reported as a regression and the exit code is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from combined8 import (read_table, report_missing_data, change_data, sort_trips, Overlap_Checker,
+                       Continuity_Checker, Timetable_comparison, Energy_Checker, Energy_Sensitivity,
+                       Charger_Checker, grid_load, plot_gantt_chart, export_pdf)
+from generate_synthetic import generate
+
+# Differences below this many seconds are noise and never a regression
+MIN_DIFFERENCE = 0.02
+
+
+def measure(func, repeat, memory):
+    """
+    Runs func repeat times and returns (result, best time in seconds, peak memory in MB or None)
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return result, best, peak
+
+
+def benchmark_size(buses, repeat=1, memory=True, max_excel_buses=100, seed=0, days=1):
+    """
+    Runs every step of the pipeline on a synthetic plan with the given amount of buses and service days
+    return: list of dicts with buses, days, rows, stage, seconds and peak_mb
+    """
+    plan, table = generate(buses=buses, days=days, overlaps=1, soc_violations=1, missing_trips=1, seed=seed)
+    results = []
+
+    def run(stage, func):
+        result, seconds, peak = measure(func, repeat, memory)
+        results.append({"buses": buses, "days": days, "rows": len(plan), "stage": stage,
+                        "seconds": round(seconds, 5), "peak_mb": None if peak is None else round(peak, 3)})
+        return result
+
+    # openpyxl is far too slow to write big workbooks, so the Excel step only runs for small fleets
+    if buses <= max_excel_buses:
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "plan.xlsx")
+            plan.to_excel(path, index=False)
+            run("excel_ingest", lambda: read_table(path, cache_dir=None))
+
+    run("report_missing_data", lambda: report_missing_data(plan))
+    df_filled = run("change_data", lambda: change_data(plan))
+    trips = run("sort_trips", lambda: sort_trips(df_filled))
+    overlaps = run("Overlap_Checker", lambda: Overlap_Checker(df_filled, trips))
+    run("Continuity_Checker", lambda: Continuity_Checker(df_filled, trips))
+    run("Timetable_comparison", lambda: Timetable_comparison(df_filled, table))
+    energy = run("Energy_Checker", lambda: Energy_Checker(df_filled))
+    run("Energy_Simulation", lambda: Energy_Checker(df_filled, simulate=True))
+    run("Energy_Sensitivity", lambda: Energy_Sensitivity(df_filled))
+    run("Charger_Checker", lambda: Charger_Checker(df_filled))
+    run("grid_load", lambda: grid_load(df_filled))
+
+    def gantt():
+        fig = plot_gantt_chart(df_filled)
+        plt.close(fig)
+        return fig
+
+    fig = run("plot_gantt_chart", gantt)
+    run("export_pdf", lambda: export_pdf(fig, overlaps, energy))
+    return results
+
+
+def compare(results, previous, threshold):
+    """
+    Compares the results with an earlier run
+    return: list of (buses, stage, old seconds, new seconds) of the steps that became slower than the threshold
+    """
+    old = {(r["buses"], r.get("days", 1), r["stage"]): r["seconds"] for r in previous["results"]}
+    regressions = []
+    for r in results:
+        before = old.get((r["buses"], r["days"], r["stage"]))
+        if before is None:
+            continue
+        if r["seconds"] > before * (1 + threshold) and r["seconds"] - before > MIN_DIFFERENCE:
+            regressions.append((r["buses"], r["stage"], before, r["seconds"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the bus plan pipeline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="fleet sizes")
+    parser.add_argument("--days", type=int, default=1, help="service days per plan, 30 is a month")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per step, the best one counts")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--max-excel-buses", type=int, default=100, help="largest fleet for the Excel step")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="JSON file of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 is 25%%")
+    args = parser.parse_args(argv)
+
+    results = []
+    for buses in args.sizes:
+        for r in benchmark_size(buses, args.repeat, not args.no_memory, args.max_excel_buses, days=args.days):
+            results.append(r)
+            memory = "" if r["peak_mb"] is None else f"{r['peak_mb']:10.1f} MB"
+            print(f"{r['buses']:>6} buses {r['rows']:>8} rows  {r['stage']:<22}{r['seconds']:10.4f} s{memory}")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "results": results,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        regressions = compare(results, previous, args.threshold)
+        for buses, stage, before, after in regressions:
+            print(f"REGRESSION {stage} with {buses} buses: {before:.4f} s -> {after:.4f} s")
+        if regressions:
+            return 1
+        print("No regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,60 +1,594 @@
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, fields
+from io import BytesIO
+
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.collections import PolyCollection
+from matplotlib.ticker import MaxNLocator
+
+# Folder where the parsed Excel files are stored as pickle, so openpyxl only has to read a file once
+# A pickle can run code when it is loaded, so only point this at a folder that nobody else can write to
+CACHE_DIR = ".plan_cache"
+# The most pickles kept in CACHE_DIR, the ones that were used longest ago are removed first
+CACHE_FILES = 32
+
+
+def prune_cache(cache_dir, keep=CACHE_FILES):
+    """
+    Removes the pickles in cache_dir that were used longest ago, until at most keep are left
+    param cache_dir: the cache folder of read_table
+    param keep: the amount of pickles that stay
+    """
+    paths = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(".pkl")]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            # Another process removed it already
+            pass
+
+
+class Profiler:
+    """
+    Measures the time and optionally the peak memory of every step of the pipeline
+    Use it as: with profiler.stage("change_data"): df_filled = change_data(df)
+    records: list of dicts with stage, seconds and peak_mb (None if memory is off)
+    """
+    def __init__(self, memory=False):
+        """
+        param memory: also measure the peak memory with tracemalloc, this makes every step slower
+        """
+        self.memory = memory
+        self.records = []
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the code in the with block, also when it raises, and stores it as a record named name
+        """
+        # A stage inside another stage only gets a time, tracemalloc is already running for the outer one
+        trace = self.memory and not tracemalloc.is_tracing()
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = None
+            if trace:
+                peak = tracemalloc.get_traced_memory()[1] / 2**20
+                tracemalloc.stop()
+            self.records.append({"stage": name, "seconds": seconds, "peak_mb": peak})
+
+    def table(self):
+        """
+        Returns the records as a DataFrame with the columns stage, seconds and peak_mb
+        """
+        return pd.DataFrame(self.records, columns=["stage", "seconds", "peak_mb"]).astype({"peak_mb": float})
+
+    def lines(self):
+        """
+        Returns the records as readable lines, one per stage and one for the total
+        """
+        return profile_lines(self.records)
+
+
+def profile_lines(records):
+    """
+    Returns Profiler records as readable lines, one per stage and one for the total
+    Also used for records that come back from another process, without the Profiler itself
+    """
+    lines = []
+    for record in records:
+        memory = "" if record["peak_mb"] is None else f"  peak {record['peak_mb']:.1f} MB"
+        lines.append(f"{record['stage']:<22}{record['seconds']:9.3f} s{memory}")
+    lines.append(f"{'total':<22}{sum(record['seconds'] for record in records):9.3f} s")
+    return lines
+
+
+def read_table(file, file_name=None, cache_dir=CACHE_DIR):
+    """
+    Loads a bus plan or timetable from an xlsx, csv or parquet file
+    An Excel file is parsed once, after that it is loaded from a pickled copy in cache_dir
+    that is named after the SHA-256 of the file, so a changed file is parsed again
+    The pickle keeps every cell as openpyxl read it, so a cached load is the same as the first load
+    A pickle that can not be read is removed and the file is parsed again, at most CACHE_FILES are kept
+    cache_dir must be a trusted folder, loading a pickle can run code
+    param file: the path of the file, or the bytes of an uploaded file
+    param file_name: the name of the uploaded file, used for the file type when file is bytes
+    param cache_dir: folder for the pickled copies, None turns the cache off
+    Returns the DataFrame
+    """
+    if isinstance(file, (bytes, bytearray)):
+        data = bytes(file)
+        name = file_name or ""
+    else:
+        name = str(file)
+        with open(file, "rb") as f:
+            data = f.read()
+
+    extension = os.path.splitext(name)[1].lower()
+    if extension == ".csv":
+        return pd.read_csv(BytesIO(data))
+    if extension == ".parquet":
+        return pd.read_parquet(BytesIO(data))
+
+    if cache_dir is None:
+        return pd.read_excel(BytesIO(data), engine='openpyxl')
+
+    cache_path = os.path.join(cache_dir, hashlib.sha256(data).hexdigest() + ".pkl")
+    if os.path.exists(cache_path):
+        try:
+            df = pd.read_pickle(cache_path)
+            # The time of last use decides which pickles prune_cache removes
+            os.utime(cache_path)
+            return df
+        except Exception:
+            # A broken or outdated pickle is removed and the file is parsed again
+            try:
+                os.remove(cache_path)
+            except OSError:
+                pass
+
+    df = pd.read_excel(BytesIO(data), engine='openpyxl')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # The pickle is written to a temporary file first and then moved in place in one step,
+        # so an interrupted write or two processes writing the same file never leave half a pickle
+        handle, temporary = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        os.close(handle)
+        try:
+            # openpyxl gives a mix of strings, numbers and datetime objects in one column, the pickle keeps them as they are
+            df.to_pickle(temporary)
+            os.replace(temporary, cache_path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        prune_cache(cache_dir)
+    except Exception:
+        # Without a cache the file is just parsed again next time
+        pass
+    return df
+
 
 def Data_Collection():
     """
-    Loads the data from the excel file
+    Loads the data from the excel, csv or parquet file
     Returns the DataFrame
     """
     file_path = input("Put your Bus plan Excel file in here: ")
-    df = pd.read_excel(file_path, engine='openpyxl')
+    df = read_table(file_path)
     file_path2 = input("Put your Timetable Excel file in here: ")
-    table = pd.read_excel(file_path2, engine='openpyxl')
+    table = read_table(file_path2)
     return df, table
 
+def clock_to_seconds(text):
+    """
+    Reads HH:MM:SS, HH:MM, H:MM:SS and H:MM strings as seconds since midnight
+    The characters are read as numbers straight from the string memory, so no date has to be parsed
+    param text: numpy array of str
+    return: float array of seconds, NaN where the string is not a time of day
+    """
+    text = text.astype(str)
+    lengths = np.char.str_len(text)
+    if not (lengths == 8).all():
+        # Leading zero for H:MM(:SS) and ':00' for HH:MM, so every time has the layout HH:MM:SS
+        text = np.char.strip(text)
+        lengths = np.char.str_len(text)
+        text = np.where((lengths == 4) | (lengths == 7), np.char.add("0", text), text)
+        lengths = np.char.str_len(text)
+        text = np.where(lengths == 5, np.char.add(text, ":00"), text)
+        lengths = np.char.str_len(text)
+
+    chars = np.ascontiguousarray(text, dtype="U8").view(np.uint32).reshape(len(text), 8).astype(np.int64) - ord("0")
+    digits = chars[:, [0, 1, 3, 4, 6, 7]]
+    hours = chars[:, 0] * 10 + chars[:, 1]
+    minutes = chars[:, 3] * 10 + chars[:, 4]
+    secs = chars[:, 6] * 10 + chars[:, 7]
+    valid = ((lengths == 8) & ((digits >= 0) & (digits <= 9)).all(axis=1)
+             & (chars[:, 2] == ord(":") - ord("0")) & (chars[:, 5] == ord(":") - ord("0"))
+             & (hours < 24) & (minutes < 60) & (secs < 60))
+    return np.where(valid, hours * 3600 + minutes * 60 + secs, np.nan)
+
+
+def time_to_seconds(times, errors="raise"):
+    """
+    Changes times of day to seconds since midnight in one vectorized pass, without a date
+    Reads HH:MM[:SS] strings, datetime.time and datetime cells and Excel fractions of a day (0.5 is 12:00)
+    param times: Series with the times
+    param errors: "raise" raises a ValueError for a time that can not be read, "coerce" makes it NaN
+    return: int32 array of seconds, or a float array with NaN if errors is "coerce"
+    """
+    times = pd.Series(times)
+    seconds = np.full(len(times), np.nan)
+
+    if pd.api.types.is_numeric_dtype(times) and not pd.api.types.is_bool_dtype(times):
+        # Excel keeps a time as a fraction of a day, a date is the whole part
+        seconds = np.round(times.to_numpy(dtype=float) % 1 * 24 * 3600)
+    elif pd.api.types.is_datetime64_any_dtype(times):
+        seconds = (times - times.dt.normalize()).dt.total_seconds().to_numpy()
+    else:
+        # A plan has few different times, so every different value is only read once
+        codes, values = pd.factorize(times)
+        values = np.asarray(values, dtype=object)
+        kinds = np.array([type(value) for value in values], dtype=object)
+        unique_seconds = np.full(len(values) + 1, np.nan)
+        text = kinds == str
+        unique_seconds[:-1][text] = clock_to_seconds(values[text].astype(str))
+        # Excel gives a time cell as datetime.time, a date and time cell as datetime.datetime
+        clock = np.array([issubclass(kind, (datetime.time, datetime.datetime)) for kind in kinds], dtype=bool)
+        unique_seconds[:-1][clock] = [value.hour * 3600 + value.minute * 60 + value.second for value in values[clock]]
+        number = np.array([issubclass(kind, (int, float, np.number)) and not issubclass(kind, (bool, np.bool_))
+                           for kind in kinds], dtype=bool)
+        unique_seconds[:-1][number] = np.round(values[number].astype(float) % 1 * 24 * 3600)
+        # Missing values have code -1, that is the NaN at the end
+        seconds = unique_seconds[codes]
+
+    if errors == "coerce":
+        return seconds
+    unreadable = np.flatnonzero(np.isnan(seconds))
+    if len(unreadable):
+        rows = ", ".join(str(row + 2) for row in unreadable[:10])
+        raise ValueError(f"Can not read the time {times.iloc[unreadable[0]]!r} in row {rows}"
+                         + (", ..." if len(unreadable) > 10 else ""))
+    return seconds.astype(np.int32)
+
+
+# Activities that start before this time of day (seconds) belong to the service day before, they are night rides
+DAY_BOUNDARY = 2 * 3600
+
+
+# Text formats of a date, the first one is the dd-mm-yyyy of the project
+DATE_FORMATS = ("%d-%m-%Y", "%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+
+def parse_dates(dates):
+    """
+    Reads dates as dd-mm-yyyy (the format of the project) or yyyy-mm-dd, datetime cells and Excel day numbers
+    Text that fits none of DATE_FORMATS is read day first, so 01-11-2025 is always the 1st of November
+    param dates: Series of dates, best only the different ones
+    return: Series of Timestamps at midnight, NaT where the date can not be read
+    """
+    dates = pd.Series(dates)
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return pd.to_datetime(dates).dt.normalize()
+    if pd.api.types.is_numeric_dtype(dates) and not pd.api.types.is_bool_dtype(dates):
+        return pd.to_datetime(dates, unit="D", origin="1899-12-30").dt.normalize()
+
+    values = dates.astype(object)
+    parsed = pd.Series(pd.NaT, index=dates.index, dtype="datetime64[ns]")
+    cells = values.map(lambda value: isinstance(value, (datetime.date, pd.Timestamp))).to_numpy(dtype=bool)
+    if cells.any():
+        parsed[cells] = pd.to_datetime(values[cells].tolist())
+    text = values[~cells & values.notna().to_numpy()].astype(str).str.strip()
+    for date_format in DATE_FORMATS:
+        text = text[parsed[text.index].isna().to_numpy()]
+        if text.empty:
+            break
+        parsed[text.index] = pd.to_datetime(text, format=date_format, errors="coerce")
+    text = text[parsed[text.index].isna().to_numpy()]
+    if not text.empty:
+        parsed[text.index] = pd.to_datetime(text, dayfirst=True, format="mixed", errors="coerce")
+    return parsed.dt.normalize()
+
+
+def service_days(dates, first=None):
+    """
+    Changes dates to the number of their service day, only the few different dates are parsed
+    param dates: Series of dates (strings, datetimes or Excel dates), text is read as dd-mm-yyyy
+    param first: the date of day 0, the earliest date if None
+    return: int64 array with the day of every row, a ValueError is raised if a date is missing or can not be read
+    """
+    codes, unique = pd.factorize(pd.Series(dates))
+    if (codes < 0).any():
+        raise ValueError(f"The date is missing in row {np.flatnonzero(codes < 0)[0] + 2}")
+    parsed = parse_dates(pd.Series(unique))
+    if parsed.isna().any():
+        wrong = int(np.flatnonzero(parsed.isna())[0])
+        raise ValueError(f"Can not read the date {unique[wrong]!r} in row {np.flatnonzero(codes == wrong)[0] + 2}")
+    first = parsed.min() if first is None else parse_dates(pd.Series([first], dtype=object)).iloc[0]
+    if pd.isna(first):
+        raise ValueError("Can not read the date of the first service day")
+    return (parsed - first).dt.days.to_numpy()[codes]
+
+
+# The activities and location codes that the checkers know
+ACTIVITIES = ("service trip", "material trip", "idle", "charging")
+LOCATIONS = ("ehvapt", "ehvbst", "ehvgar")
+
+
+def normalize_locations(locations):
+    """
+    Writes location codes in one way, without spaces around them and in lower case
+    All checkers and the data-quality report compare locations like this, so 'EHVBST ' is ehvbst
+    param locations: Series or Index with the locations
+    return: the same Series or Index as text, missing values stay missing
+    """
+    return locations.astype(str).str.strip().str.lower()
+
+
+@dataclass
+class DataQualityReport:
+    """
+    Result of report_missing_data
+    missing: DataFrame of booleans, True where a value is missing ('line' is left out, only trips have a line)
+    missing_rows: the rows with at least one missing value
+    unparsable_times: the rows with a start or end time that time_to_seconds can not read
+    unknown_activities: the rows with an activity that is not in ACTIVITIES
+    unknown_locations: the rows with a start or end location that is not in LOCATIONS
+    negative_durations: the rows that end before they start (and do not cross midnight)
+    All rows are arrays with the index of the rows in the DataFrame
+    """
+    missing: pd.DataFrame
+    missing_rows: np.ndarray
+    unparsable_times: np.ndarray
+    unknown_activities: np.ndarray
+    unknown_locations: np.ndarray
+    negative_durations: np.ndarray
+
+    @property
+    def ok(self):
+        """
+        True if no row has a problem
+        """
+        return not (len(self.missing_rows) or len(self.unparsable_times) or len(self.unknown_activities)
+                    or len(self.unknown_locations) or len(self.negative_durations))
+
+    def table(self, examples=10):
+        """
+        Returns one row per problem with the amount of rows and the first Excel row numbers
+        Missing values get one row per column
+        param examples: the amount of row numbers that is shown per problem
+        """
+        problems = [(f"missing {column}", self.missing.index[self.missing[column].to_numpy()].to_numpy())
+                    for column in self.missing.columns[self.missing.any().to_numpy()]]
+        problems += [
+            ("unparsable time", self.unparsable_times),
+            ("unknown activity", self.unknown_activities),
+            ("unknown location", self.unknown_locations),
+            ("negative duration", self.negative_durations),
+        ]
+        rows = []
+        for problem, found in problems:
+            if len(found) == 0:
+                continue
+            # The header is row 1 in Excel, so the first row of the DataFrame is row 2
+            excel_rows = found + 2
+            shown = ", ".join(str(row) for row in excel_rows[:examples])
+            rows.append({"problem": problem, "rows": len(found),
+                         "excel rows": shown + (", ..." if len(found) > examples else "")})
+        return pd.DataFrame(rows, columns=["problem", "rows", "excel rows"])
+
+    def lines(self):
+        """
+        Returns the result as readable lines, one per problem
+        """
+        if self.ok:
+            return ["No missing or invalid data found."]
+        return [f"{problem['problem']}: {problem['rows']} rows (row {problem['excel rows']})"
+                for _, problem in self.table().iterrows()]
+
+
 def report_missing_data(df):
     """
-    Reports when data is missing in the DataFrame
+    Checks the plan on missing values, times that can not be read, unknown activities and
+    locations and activities that end before they start, column by column
+    param df: the plan as it is read from the file
+    return: DataQualityReport with the rows of every problem
+    """
+    missing = df.drop(columns="line", errors="ignore").isnull()
+    index = df.index.to_numpy()
+
+    def rows(mask):
+        return index[np.asarray(mask, dtype=bool)]
+
+    # The same parser as change_data, so every time that is flagged here would make change_data fail
+    seconds = {}
+    unparsable = np.zeros(len(df), dtype=bool)
+    for column in ("start time", "end time"):
+        if column not in df.columns:
+            seconds[column] = np.full(len(df), np.nan)
+            continue
+        seconds[column] = time_to_seconds(df[column], errors="coerce")
+        unparsable |= np.isnan(seconds[column]) & df[column].notna().to_numpy()
+
+    if "activity" in df.columns:
+        unknown_activities = df["activity"].notna() & ~df["activity"].isin(ACTIVITIES)
+    else:
+        unknown_activities = np.zeros(len(df), dtype=bool)
+
+    unknown_locations = np.zeros(len(df), dtype=bool)
+    for column in ("start location", "end location"):
+        if column in df.columns:
+            unknown_locations |= (df[column].notna() & ~normalize_locations(df[column]).isin(LOCATIONS)).to_numpy()
+
+    # An end time before the start time is read as the next day, unless that makes the activity
+    # longer than 12 hours, then the times are the wrong way around
+    difference = seconds["end time"] - seconds["start time"]
+    negative = (difference < 0) & (difference > -12 * 3600)
+
+    return DataQualityReport(
+        missing=missing,
+        missing_rows=rows(missing.any(axis=1)),
+        unparsable_times=rows(unparsable),
+        unknown_activities=rows(unknown_activities),
+        unknown_locations=rows(unknown_locations),
+        negative_durations=rows(negative),
+    )
+
+@dataclass(frozen=True)
+class VehicleModel:
+    """
+    Battery and charging model of one bus type, used by every energy calculation
+    name: the name of the bus type
+    soh: the state of health of the battery in kWh
+    min_level: the minimum battery level as a fraction of the soh
+    max_level: the battery level at the start of the day as a fraction of the soh
+    charge_power: the charging speed in kW
+    idle_power: the energy use while idle in kW
+    cv_level: the battery level (fraction of the soh) where the charger goes from constant current
+              to constant voltage and the power goes down, only used by the charging simulation
     """
-    copy = df.copy()
-    copy = copy.drop("line", axis=1)
-    missing_data = copy.isnull()
-      
-    for i in range(len(copy)):
-        if missing_data.iloc[i,:].any():
-            print(f'Missing data in row {i+2}')
+    name: str = "standard"
+    soh: float = 255
+    min_level: float = 0.1
+    max_level: float = 0.9
+    charge_power: float = 450
+    idle_power: float = 5
+    cv_level: float = 0.8
 
-    return missing_data
+    def __post_init__(self):
+        if self.soh <= 0 or self.charge_power <= 0 or self.idle_power < 0:
+            raise ValueError(f"Vehicle model {self.name}: soh and charge_power must be positive and idle_power not negative")
+        if not 0 <= self.min_level < self.max_level <= 1:
+            raise ValueError(f"Vehicle model {self.name}: min_level and max_level must be fractions with min_level < max_level")
+        if not 0 < self.cv_level <= 1:
+            raise ValueError(f"Vehicle model {self.name}: cv_level must be a fraction above 0")
 
-def change_data(df):
+
+DEFAULT_VEHICLE = VehicleModel()
+
+
+@dataclass(frozen=True)
+class Fleet:
+    """
+    The vehicle model of every bus, for a fleet with more bus types
+    models: the vehicle models by name
+    buses: the name of the model per bus number (as text), the other buses get the default model
+    default: the name of the model of the other buses
+    """
+    models: dict
+    buses: dict
+    default: str
+
+    def __post_init__(self):
+        unknown = sorted({self.default, *self.buses.values()} - set(self.models))
+        if unknown:
+            raise ValueError(f"Unknown vehicle model(s): {', '.join(unknown)}")
+
+    def columns(self, buses, names=None):
+        """
+        Returns the parameters of the vehicle model of every bus in buses
+        Every different bus is only looked up once, so this is fast for a big plan
+        param buses: Series with the bus of every row
+        param names: the VehicleModel fields that are needed, default all of them
+        return: DataFrame with the index of buses and a column per field
+        """
+        buses = pd.Series(buses)
+        names = names or [field.name for field in fields(VehicleModel)]
+        codes, uniques = pd.factorize(buses)
+        keys = [self.buses.get(str(bus), self.default) for bus in uniques]
+        models = [self.models[key] for key in keys]
+        table = {}
+        for name in names:
+            # The name is the key of the model in models
+            values = keys if name == "name" else [getattr(model, name) for model in models]
+            if name == "name":
+                categories, value_codes = np.unique(values, return_inverse=True)
+                table[name] = pd.Categorical.from_codes(value_codes[codes], categories)
+            else:
+                table[name] = np.array(values, dtype=float)[codes]
+        return pd.DataFrame(table, index=buses.index)
+
+
+def as_fleet(vehicle):
+    """
+    Returns a Fleet for a VehicleModel (every bus the same) or a Fleet
+    """
+    if isinstance(vehicle, Fleet):
+        return vehicle
+    return Fleet(models={vehicle.name: vehicle}, buses={}, default=vehicle.name)
+
+
+def load_fleet(file):
+    """
+    Loads the vehicle models from a JSON file, so the battery and charger can be changed without editing code
+    Either one model: {"soh": 300, "charge_power": 300}
+    or more bus types: {"models": [{"name": "standard"}, {"name": "long", "soh": 350}],
+                        "buses": {"5": "long", "6": "long"}, "default": "standard"}
+    Fields that are left out get the value of DEFAULT_VEHICLE
+    param file: the path of the file, or the bytes of an uploaded file
+    return: Fleet
+    """
+    if isinstance(file, (bytes, bytearray)):
+        data = json.loads(bytes(file))
+    else:
+        with open(file) as f:
+            data = json.load(f)
+
+    known = {field.name for field in fields(VehicleModel)}
+    def model(values):
+        unknown = sorted(set(values) - known)
+        if unknown:
+            raise ValueError(f"Unknown vehicle model field(s): {', '.join(unknown)}")
+        return VehicleModel(**values)
+
+    if "models" not in data:
+        return as_fleet(model(data))
+    models = {vehicle.name: vehicle for vehicle in map(model, data["models"])}
+    default = data.get("default", next(iter(models), DEFAULT_VEHICLE.name))
+    return Fleet(models=models, buses={str(bus): name for bus, name in data.get("buses", {}).items()}, default=default)
+
+
+def change_data(df, day_boundary=DAY_BOUNDARY, vehicle=DEFAULT_VEHICLE):
+    """
+    Makes the PlanFrame that all checkers and the Gantt chart use: the plan with seconds, without gaps
+    and with compact types, so a big plan is stored once and small
+      bus: ordered category, the day buses first and the buses that drive after midnight last
+      start location, end location, activity, line, date: category
+      start time, end time: category of HH:MM:SS strings, empty for the idle rows that fill a gap
+      start_seconds, end_seconds: int32 seconds since midnight of the first service day,
+                                  after midnight the next day is added
+      service_day: int16, 0 for the first service day
+      start_shifted, end_shifted: int32 seconds since the day boundary of the first service day, used for the Gantt chart
+      energy consumption: float32 kWh
+    A plan with a 'date' column (the service day of every row) is a plan of more days, the gaps
+    between two service days are not filled, so the battery level carries over the night
+    The checkers only read the PlanFrame, it is never changed or copied as a whole after change_data
+    param df: the plan as it is read from the file
+    param day_boundary: the time of day in seconds where a service day starts
+    param vehicle: the VehicleModel or Fleet, its idle_power gives the energy of the idle rows
+    """
 
     def read_and_change_data(df):
         """
         Loads the data from the excel file
-        Changes all the start and end times to HH-MM-SS
+        Changes all the start and end times to seconds since midnight of the first service day,
+        the time columns are kept as they are
         Changes the routes that are ran in night time to 1 day later
         """
         df = df.copy()
-        
-        datum = "31-10-2025"
-        
-        df["start time"] = df["start time"].astype(str)
-        df["end time"] = df["end time"].astype(str)
-
-        # Nu kunnen we de datum en tijd veilig combineren en converteren naar datetime objecten
-        df["start time"] = pd.to_datetime(datum + " " + df["start time"], format="%d-%m-%Y %H:%M:%S")
-        df["end time"] = pd.to_datetime(datum + " " + df["end time"], format="%d-%m-%Y %H:%M:%S")
-        
-        df["start_seconds"] = df["start time"].dt.hour * 3600 + df["start time"].dt.minute * 60 + df["start time"].dt.second
-        df["end_seconds"] = df["end time"].dt.hour * 3600 + df["end time"].dt.minute * 60 + df["end time"].dt.second
+
+        df["start_seconds"] = time_to_seconds(df["start time"])
+        df["end_seconds"] = time_to_seconds(df["end time"])
 
         df.loc[df["end_seconds"] < df["start_seconds"], "end_seconds"] += 24 * 3600
 
-        night_rides = (df["start_seconds"] >= 0) & (df["start_seconds"] < 2 * 3600)
+        night_rides = (df["start_seconds"] >= 0) & (df["start_seconds"] < day_boundary)
         df.loc[night_rides, "start_seconds"] += 24 * 3600
         df.loc[night_rides, "end_seconds"] += 24 * 3600
 
+        if "date" in df.columns:
+            days = service_days(df["date"])
+        else:
+            days = np.zeros(len(df), dtype=np.int64)
+        df["service_day"] = days.astype(np.int16)
+        df["start_seconds"] += (days * 24 * 3600).astype(np.int32)
+        df["end_seconds"] += (days * 24 * 3600).astype(np.int32)
+
         return df
 
     def replace_empty_gaps_with_idle(df):
@@ -62,298 +596,1370 @@ def change_data(df):
         """
         Changes the activity of the bus to idle, if there is no activity planned for the bus
         Removes gaps in the bus planning with idle
+        The idle rows are built as columns for all buses at once and added with one concat
         param df: The data set where all bus routes are located in
         """
-        df1 = df.copy()
-
-        df1 = df[df['start time'] != df['end time']]
-
-        filled_rows = []
-        for bus, bus_df in df1.groupby("bus"):
-            bus_df = bus_df.sort_values("start_seconds").reset_index(drop=True)
-            prev_end = None
-            for _, row in bus_df.iterrows():
-                current_start = row["start_seconds"]
-                current_end = row["end_seconds"]
-
-                if prev_end is not None and current_start > prev_end:
-                    filled_rows.append({
-                        "bus": bus,
-                        "start_seconds": prev_end,
-                        "end_seconds": current_start,
-                        "activity": "idle"
-                    })
-
-                filled_rows.append(row.to_dict())
-                prev_end = current_end
-
-        df_filled = pd.DataFrame(filled_rows)
-        df_filled = df_filled[df_filled["end_seconds"] > df_filled["start_seconds"]]
-
-        if "energy consumption" not in df_filled.columns:
-            df_filled["energy consumption"] = 0.0
+        df1 = df[df['start_seconds'] != df['end_seconds']]
+        df1 = df1.sort_values(["bus", "start_seconds"], kind="stable").reset_index(drop=True)
+
+        if "energy consumption" not in df1.columns:
+            df1["energy consumption"] = 0.0
+
+        # A gap is the time between the end of the previous activity of the same bus and the start of the next one,
+        # the night between two service days is not a gap
+        prev_end = df1.groupby(["bus", "service_day"], sort=False)["end_seconds"].shift()
+        gap = (df1["start_seconds"] > prev_end).to_numpy()
+
+        idle_start = prev_end[gap].astype(df1["end_seconds"].dtype).to_numpy()
+        idle_end = df1.loc[gap, "start_seconds"].to_numpy()
+        idle_rows = pd.DataFrame({
+            "bus": df1.loc[gap, "bus"].to_numpy(),
+            "start_seconds": idle_start,
+            "end_seconds": idle_end,
+            "activity": "idle",
+            "service_day": df1.loc[gap, "service_day"].to_numpy(),
+        })
+        if "date" in df1.columns:
+            idle_rows["date"] = df1.loc[gap, "date"].to_numpy()
+
+        # Every idle row is placed directly before the activity that ends its gap
+        order = np.concatenate([np.arange(len(df1)) * 2 + 1, np.flatnonzero(gap) * 2])
+        df_filled = pd.concat([df1, idle_rows], ignore_index=True)
+        df_filled = df_filled.iloc[np.argsort(order, kind="stable")]
+        df_filled = df_filled[df_filled["end_seconds"] > df_filled["start_seconds"]].reset_index(drop=True)
 
         idle_mask = df_filled["activity"] == "idle"
+        idle_power = as_fleet(vehicle).columns(df_filled.loc[idle_mask, "bus"], ["idle_power"])["idle_power"]
         df_filled.loc[idle_mask, "energy consumption"] = (
             (df_filled.loc[idle_mask, "end_seconds"] - df_filled.loc[idle_mask, "start_seconds"]) / 3600
-        ) * 5   # 5 kW idle-verbruik
+        ) * idle_power   # idle-verbruik in kW
 
         return df_filled 
 
     def night_rides_next_day(df_filled):
         """
-        Changes routes that are run after 23:59 to the next day in the schedule
+        Puts the buses that drive after 23:59 last and adds the seconds for the Gantt chart
         param df_filled: the data set filled with idles 
         """
 
-        night_rides = (df_filled["start_seconds"] >= 0) & (df_filled["start_seconds"] < 2 * 3600)
-        df_filled.loc[night_rides, "start_seconds"] += 24 * 3600
-        df_filled.loc[night_rides, "end_seconds"] += 24 * 3600
-
-        bus_max_end = df_filled.groupby("bus")["end_seconds"].max()
+        # read_and_change_data already moved the night rides, here the buses that drive them are put last
+        end_of_day = df_filled["end_seconds"] - df_filled["service_day"].astype(np.int32) * 24 * 3600
+        bus_max_end = end_of_day.groupby(df_filled["bus"]).max()
         night_buses = bus_max_end[bus_max_end > 24 * 3600].index
         day_buses = bus_max_end[bus_max_end <= 24 * 3600].index
         bus_order = list(day_buses) + list(night_buses)
         df_filled["bus"] = pd.Categorical(df_filled["bus"], categories=bus_order, ordered=True)
 
-        df_filled["start_shifted"] = df_filled["start_seconds"] - 4 * 3600
-        df_filled["end_shifted"] = df_filled["end_seconds"] - 4 * 3600
-        df_filled.loc[df_filled["start_shifted"] < 0, "start_shifted"] += 24 * 3600
-        df_filled.loc[df_filled["end_shifted"] < 0, "end_shifted"] += 24 * 3600
+        # The night rides are already a day later, so every time is after the day boundary of its service day
+        df_filled["start_shifted"] = df_filled["start_seconds"] - int(day_boundary)
+        df_filled["end_shifted"] = df_filled["end_seconds"] - int(day_boundary)
 
         return df_filled
     
+    def compact_types(df_filled):
+        """
+        Gives the columns the PlanFrame types
+        A time of day is stored once as a category, every row only keeps the number of its time
+        param df_filled: the data set after night_rides_next_day
+        """
+        for column in ("start location", "end location", "activity", "line", "date"):
+            if column in df_filled.columns:
+                df_filled[column] = df_filled[column].astype("category")
+
+        for column, seconds in (("start time", "start_seconds"), ("end time", "end_seconds")):
+            known = df_filled[column].notna().to_numpy()
+            codes = np.full(len(df_filled), -1, dtype=np.int32)
+            times, codes[known] = np.unique(df_filled[seconds].to_numpy()[known] % (24 * 3600), return_inverse=True)
+            df_filled[column] = pd.Categorical.from_codes(codes, categories=seconds_to_time(times).to_numpy(), ordered=True)
+
+        df_filled["energy consumption"] = df_filled["energy consumption"].astype(np.float32)
+        return df_filled
+
     df = read_and_change_data(df)
     df_filled = replace_empty_gaps_with_idle(df)
     df_filled = night_rides_next_day(df_filled)
+    df_filled = compact_types(df_filled)
 
     return df_filled
 
-def Overlap_Checker(df_filled):
+@dataclass
+class TripOrder:
+    """
+    The planned trips sorted once on bus and start time, shared by Overlap_Checker and Continuity_Checker
+    planned: the rows of the plan that are not idle rows added by change_data
+    bus_codes: the number of the bus of every planned row
+    order: the positions in planned sorted on bus and start time
+    sorted_starts, sorted_ends: the sort keys of the start and end in that order, every bus has
+                                its own block of seconds so trips of different buses never mix
+    """
+    planned: pd.DataFrame
+    bus_codes: np.ndarray
+    order: np.ndarray
+    sorted_starts: np.ndarray
+    sorted_ends: np.ndarray
+
+
+def sort_trips(df_filled):
+    """
+    Sorts the planned trips on bus and start time with one argsort for the whole fleet
+    param df_filled: the PlanFrame made by change_data
+    return: TripOrder
+    """
+    # Idle rows that change_data added have no start time, they only fill gaps so they are skipped.
+    planned = df_filled[df_filled['start time'].notna()]
+    if planned.empty:
+        empty = np.zeros(0, dtype=np.int64)
+        return TripOrder(planned, empty, empty, empty, empty)
+
+    bus_codes = pd.Categorical(planned['bus']).codes.astype(np.int64)
+    starts = planned['start_seconds'].to_numpy(dtype=np.int64)
+    ends = planned['end_seconds'].to_numpy(dtype=np.int64)
+
+    # One sort key for the whole fleet: every bus gets its own block of seconds, so trips of
+    # different buses can never be found by the same searchsorted.
+    base = min(starts.min(), ends.min())
+    span = max(starts.max(), ends.max()) - base + 1
+    start_keys = bus_codes * span + (starts - base)
+    end_keys = bus_codes * span + (ends - base)
+
+    order = np.argsort(start_keys, kind='stable')
+    return TripOrder(planned, bus_codes, order, start_keys[order], end_keys[order])
+
+
+def Overlap_Checker(df_filled, trips=None):
     """
     Checks if the in the current busplan if there are overlapping trips for each bus.
+    All trips are sorted once on bus and start time, then searchsorted finds for every trip
+    the trips of the same bus that start before it ends, so no pair loop is needed.
     :param df: The given dataframe
+    :param trips: the TripOrder of sort_trips, it is made here if it is not given
+    :return: List of tuples with the bus, both row numbers and the data of both overlapping trips
     """
-    def check_overlaps(group):
-        """
-        Function to check overlapping time in trips for a single bus.
-        :param group: Group of trips for a single bus
-        :return: List of overlapping trips (with row numbers)
-        """
-        overlaps = []
-        # .groupby resets the index, this prevents the reset of the original index when sorting by bus later in the code.
-        group = group.reset_index(drop=False)
-
-        for i in range(len(group)):
-            for j in range(i + 1, len(group)):
-                # It is an overlap if the end time of a trip is after the start time of a trip after the first.
-                # Start time of a trip should be before the end of a trip after the first, so that there is no overlap with midnight trips.
-                if (group.loc[i, 'start time'] < group.loc[j, 'end time'] and
-                    group.loc[j, 'start time'] < group.loc[i, 'end time']):
-                    #appends in a in a tuple, so that there is a list with tuples of the data of the overlapping trips.
-                    overlaps.append((
-                        group.loc[i, 'index'],
-                        group.loc[j, 'index'],
-                        group.loc[i, 'start location'], group.loc[i, 'end location'],
-                        group.loc[i, 'start time'], group.loc[i, 'end time'],
-                        group.loc[j, 'start location'], group.loc[j, 'end location'],
-                        group.loc[j, 'start time'], group.loc[j, 'end time'],
-                    ))
-        return overlaps
-    # Group by bus and run the check_overlaps function.
-    overlap_results = []
-    grouped = df_filled.groupby('bus')
-    # For each bus, repeats the amount that the group is long.
-    for bus, group in grouped:
-        overlaps = check_overlaps(group)
-        for o in overlaps:
-            overlap_results.append((bus, *o))
-    
-    return overlap_results
+    if trips is None:
+        trips = sort_trips(df_filled)
+    planned, bus_codes, order = trips.planned, trips.bus_codes, trips.order
+    sorted_starts, sorted_ends = trips.sorted_starts, trips.sorted_ends
+    if planned.empty:
+        return []
+
+    # For trip k all trips between k and the first trip that starts at or after its end overlap with it.
+    n = len(order)
+    stop = np.searchsorted(sorted_starts, sorted_ends, side='left')
+    counts = np.maximum(stop - np.arange(n) - 1, 0)
+    first = np.repeat(np.arange(n), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    second = first + 1 + offsets
+    # Both trips must end after the other one starts (filters out trips with no duration).
+    real = sorted_starts[first] < sorted_ends[second]
+    first, second = order[first[real]], order[second[real]]
+
+    # Report every pair in plan order, just like the old pair loop did per bus.
+    row_i = np.minimum(first, second)
+    row_j = np.maximum(first, second)
+    pair_order = np.lexsort((row_j, row_i, bus_codes[row_i]))
+    row_i, row_j = row_i[pair_order], row_j[pair_order]
+
+    def column(name, rows):
+        return planned[name].take(rows).tolist()
+
+    return list(zip(
+        column('bus', row_i),
+        planned.index.take(row_i).tolist(),
+        planned.index.take(row_j).tolist(),
+        column('start location', row_i), column('end location', row_i),
+        column('start time', row_i), column('end time', row_i),
+        column('start location', row_j), column('end location', row_j),
+        column('start time', row_j), column('end time', row_j),
+    ))
+
+
+def Continuity_Checker(df_filled, trips=None):
+    """
+    Checks that every bus starts an activity where its previous activity ended
+    Uses the same sorted order as Overlap_Checker and compares the end location of every trip
+    with the start location of the next trip of the same bus in one shifted comparison
+    Location codes are compared without capitals and spaces, a missing location is left to report_missing_data
+    param df_filled: the PlanFrame made by change_data
+    param trips: the TripOrder of sort_trips, it is made here if it is not given
+    return: List of tuples with the bus, both row numbers, the end location and end time of the first
+            activity and the start location and start time of the next one
+    """
+    if trips is None:
+        trips = sort_trips(df_filled)
+    planned, order = trips.planned, trips.order
+    if len(order) < 2:
+        return []
+
+    # Both location columns get numbers from one list of location names
+    starts = pd.Categorical(planned['start location'])
+    ends = pd.Categorical(planned['end location'])
+    def normalized(locations):
+        return normalize_locations(locations.categories)
+
+    names = pd.Index(normalized(starts).append(normalized(ends)).unique())
+
+    def location_codes(locations):
+        to_name = names.get_indexer(normalized(locations))
+        codes = locations.codes
+        return np.where(codes >= 0, to_name[codes], -1)
+
+    start_codes = location_codes(starts)[order]
+    end_codes = location_codes(ends)[order]
+    bus_codes = trips.bus_codes[order]
+
+    previous, following = order[:-1], order[1:]
+    jump = ((bus_codes[:-1] == bus_codes[1:]) & (end_codes[:-1] != start_codes[1:])
+            & (end_codes[:-1] >= 0) & (start_codes[1:] >= 0))
+    row_i, row_j = previous[jump], following[jump]
+
+    # Report every pair in plan order
+    pair_order = np.lexsort((row_j, row_i, trips.bus_codes[row_i]))
+    row_i, row_j = row_i[pair_order], row_j[pair_order]
+
+    def column(name, rows):
+        return planned[name].take(rows).tolist()
+
+    return list(zip(
+        column('bus', row_i),
+        planned.index.take(row_i).tolist(),
+        planned.index.take(row_j).tolist(),
+        column('end location', row_i), column('end time', row_i),
+        column('start location', row_j), column('start time', row_j),
+    ))
+
+
+def continuity_lines(jumps):
+    """
+    Returns the result of Continuity_Checker as readable lines, one per location jump
+    """
+    if not jumps:
+        return ["Every bus starts each activity where the previous one ended."]
+    return [f"Bus {bus}: row {row_i} ends at {end} ({end_time}), row {row_j} starts at {start} ({start_time})"
+            for bus, row_i, row_j, end, end_time, start, start_time in jumps]
 
-def Timetable_comparison(df, table):
+
+@dataclass
+class TimetableComparison:
     """
-    Function to check if the bus plan correctly compares to the time table.
-    The file name of the timetable should always be 'Timetable.xlsx'
+    Result of Timetable_comparison
+    matched: the service trips that are in the timetable, with their row in the plan and in the timetable
+    missing: the timetable trips that are not driven by any service trip
+    unplanned: the service trips that are not in the timetable
+    duplicated: the timetable trips that are driven by more than one service trip, with 'times_driven'
+    unreadable: the timetable rows of trips with a departure that can not be read, they are not in missing
     """
-    # Let op: De df die hier binnenkomt is df_filled en bevat datetime objecten
-    
-    # Gebruik de originele Timetable.xlsx, welke bij mij lokaal als CSV beschikbaar is.
-    # Als deze file in jouw omgeving Timetable.xlsx heet, werkt de read_excel
-    table = table.copy()
-    dfc = df.copy()
-
-    # Zorgen dat de departure_time in de timetable ook als string wordt behandeld
-    table['departure_time'] = table['departure_time'].astype(str)
-    table['departure_time'] = pd.to_datetime(table['departure_time'], format='%H:%M', errors='coerce')
-    
-    # dfc['start time'] is al een datetime object, dus direct .dt.hour etc. gebruiken
-    
-    dfc['start time'] = (
-        dfc['start time'].dt.hour * 3600 +
-        dfc['start time'].dt.minute * 60 +
-        dfc['start time'].dt.second)
+    matched: pd.DataFrame
+    missing: pd.DataFrame
+    unplanned: pd.DataFrame
+    duplicated: pd.DataFrame
+    unreadable: np.ndarray
+
+    @property
+    def corresponds(self):
+        """
+        True if every service trip is in the timetable and every timetable trip is driven exactly once
+        """
+        return self.unplanned.empty and self.missing.empty and self.duplicated.empty and not len(self.unreadable)
+
+    def lines(self):
+        """
+        Returns the result as readable lines, one per trip that does not correspond
+        """
+        if self.corresponds:
+            return ['The current bus plan corresponds to the timetable.']
+
+        # In a plan of more days the departure also gets its day
+        multi_day = any((frame['departure_seconds'] >= 24 * 3600).any()
+                        for frame in (self.matched, self.missing, self.unplanned))
+
+        def trip(frame):
+            departures = seconds_to_time(frame['departure_seconds'])
+            if multi_day:
+                departures = ('day ' + (frame['departure_seconds'] // (24 * 3600) + 1).astype(int).astype(str)
+                              + ' ' + departures)
+            return zip(frame['line'], frame['start location'], frame['end location'], departures)
+
+        lines = ['The current bus plan does not correspond to the timetable in the following rows:']
+        for row, (line, start, end, departure) in zip(self.unplanned['plan_row'], trip(self.unplanned)):
+            lines.append(f"Row {row}   Line {line} from {start} to {end} at {departure} is not in the timetable.")
+        for row, (line, start, end, departure) in zip(self.missing['timetable_row'], trip(self.missing)):
+            lines.append(f"Timetable row {row}   Line {line} from {start} to {end} at {departure} is not driven by any bus.")
+        for row, times, (line, start, end, departure) in zip(self.duplicated['timetable_row'], self.duplicated['times_driven'], trip(self.duplicated)):
+            lines.append(f"Timetable row {row}   Line {line} from {start} to {end} at {departure} is driven {times} times.")
+        for row in self.unreadable:
+            lines.append(f"Timetable row {row}   The departure time can not be read.")
+        return lines
+
+
+def seconds_to_time(seconds):
+    """
+    Changes seconds since midnight to HH:MM:SS strings
+    param seconds: Series of seconds
+    """
+    return pd.to_datetime(pd.Series(seconds) % (24 * 3600), unit='s').dt.strftime('%H:%M:%S')
+
 
-    table['departure_time'] = (
-        table['departure_time'].dt.hour * 3600 +
-        table['departure_time'].dt.minute * 60 +
-        table['departure_time'].dt.second)
+# A service trip drives a timetable trip if all of these are the same
+TRIP_KEYS = ['line', 'start location', 'end location', 'departure_seconds']
 
-    table.sort_values('departure_time', inplace=True)
-    dfc.sort_values('start time', inplace=True)
 
-    dfc.reset_index(drop=True, inplace=True)
-    table.reset_index(drop=True, inplace=True)
+def nearest_departures(plan_trips, timetable_trips, tolerance):
+    """
+    Matches every service trip to the nearest timetable departure on the same line and locations
+    Both sides are sorted on departure once, merge_asof then finds the nearest departure per trip
+    param plan_trips: the service trips with plan_row and the TRIP_KEYS
+    param timetable_trips: the timetable trips with timetable_row, trip_id and the TRIP_KEYS
+    param tolerance: the maximum difference in seconds
+    return: the joined trips in the same layout as an outer merge with indicator, with deviation_seconds
+    """
+    by = TRIP_KEYS[:-1]
+    # merge_asof needs the same dtype for the by keys on both sides, an empty side is still object
+    locations = {column: str for column in by if column != 'line'}
+    timetable = (timetable_trips.dropna(subset=['departure_seconds'])
+                 .astype({'departure_seconds': 'int64', **locations})
+                 .rename(columns={'departure_seconds': 'timetable_departure'})
+                 .sort_values('timetable_departure'))
+    plan = plan_trips.astype({'departure_seconds': 'int64', **locations}).sort_values('departure_seconds')
+
+    nearest = pd.merge_asof(plan, timetable, left_on='departure_seconds', right_on='timetable_departure',
+                            by=by, direction='nearest', tolerance=int(tolerance))
+    found = nearest['trip_id'].notna()
+    nearest['deviation_seconds'] = nearest['departure_seconds'] - nearest['timetable_departure']
+    nearest['_merge'] = np.where(found, 'both', 'left_only')
+
+    not_driven = timetable_trips[~timetable_trips['trip_id'].isin(nearest.loc[found, 'trip_id'])]
+    not_driven = not_driven.assign(_merge='right_only')
 
-    dfc = dfc[dfc['activity'] == 'service trip']
-    if dfc['start time'].isin(table['departure_time']).all():
-        print(f'\nThe current bus plan corresponds to the timetable.')
+    return pd.concat([nearest.drop(columns='timetable_departure'), not_driven], ignore_index=True)
+
+
+def Timetable_comparison(df, table, tolerance=0):
+    """
+    Function to check if the bus plan correctly compares to the time table.
+    The service trips and the timetable trips are joined on line, start location, end location
+    and departure time with a hash join, so the comparison is linear in the amount of trips.
+    With a tolerance every service trip is matched to the nearest departure on the same line and
+    locations that is at most tolerance seconds away, using a sorted as-of join.
+    The locations of both sides are compared with normalize_locations, like in the other checkers.
+    param df: df_filled, the plan made by change_data
+    param table: the timetable with the columns line, start location (or start), end location (or end)
+                 and the departure in departure_time or start time (HH:MM or anything time_to_seconds reads),
+                 with an 'activity' column only its service trips are used, rows without a line are skipped
+    param tolerance: the maximum difference in seconds between the plan and the timetable departure
+    return: TimetableComparison with the matched, missing, unplanned and duplicated trips,
+            matched has the 'deviation_seconds' of every trip (plan minus timetable),
+            unreadable has the timetable rows with a departure that can not be read
+    For a plan of more days the departures are seconds since midnight of the first service day.
+    A timetable with a 'date' column is matched day by day, a timetable without one is driven every day.
+    """
+    departure_column = 'departure_time' if 'departure_time' in table.columns else 'start time'
+    start_column = 'start location' if 'start location' in table.columns else 'start'
+    end_column = 'end location' if 'end location' in table.columns else 'end'
+    if 'activity' in table.columns:
+        # A plan used as timetable also has material trips, idles and charging, only its service trips are driven
+        table = table[table['activity'] == 'service trip']
+
+    timetable_trips = pd.DataFrame({
+        'timetable_row': table.index,
+        'line': pd.to_numeric(table['line'], errors='coerce').astype('Int64'),
+        'start location': normalize_locations(table[start_column]).to_numpy(),
+        'end location': normalize_locations(table[end_column]).to_numpy(),
+        'departure_seconds': time_to_seconds(table[departure_column], errors='coerce'),
+    })
+
+    days = int(df['service_day'].max()) + 1 if len(df) else 1
+    if 'date' in table.columns and 'date' in df.columns:
+        first = df.loc[df['service_day'] == 0, 'date'].iloc[0]
+        timetable_trips['departure_seconds'] += service_days(table['date'], first) * 24 * 3600
+
+    # A row without a line or a departure can never be matched, a trip with a departure that
+    # can not be read is reported on its own instead of as a trip that is not driven
+    has_line = timetable_trips['line'].notna()
+    readable = timetable_trips['departure_seconds'].notna()
+    unreadable = timetable_trips.loc[has_line & ~readable, 'timetable_row'].to_numpy()
+    timetable_trips = timetable_trips[has_line & readable].reset_index(drop=True)
+
+    if days > 1 and not ('date' in table.columns and 'date' in df.columns):
+        # The same timetable on every service day of the plan
+        trips_per_day = len(timetable_trips)
+        rows = np.tile(np.arange(trips_per_day), days)
+        timetable_trips = timetable_trips.iloc[rows].reset_index(drop=True)
+        timetable_trips['departure_seconds'] += np.repeat(np.arange(days), trips_per_day) * 24 * 3600
+    # A timetable row is a different trip on every day it is driven
+    timetable_trips['trip_id'] = np.arange(len(timetable_trips))
+
+    service = df[df['activity'] == 'service trip']
+    # start_seconds can be moved to the next day by change_data, the timetable only has the time of day,
+    # so the departure is the time of day on the service day of the trip
+    plan_trips = pd.DataFrame({
+        'plan_row': service.index,
+        'line': pd.to_numeric(service['line'], errors='coerce').astype('Int64').array,
+        'start location': normalize_locations(service['start location']).to_numpy(),
+        'end location': normalize_locations(service['end location']).to_numpy(),
+        'departure_seconds': (service['start_seconds'].to_numpy() % (24 * 3600)
+                              + service['service_day'].to_numpy().astype(np.int64) * 24 * 3600),
+    })
+
+    if tolerance:
+        joined = nearest_departures(plan_trips, timetable_trips, tolerance)
     else:
-        table['departure_time'] = pd.to_datetime(table['departure_time'],unit='s').dt.strftime('%H:%M:%S')
-        dfc['start time'] = pd.to_datetime(dfc['start time'],unit='s').dt.strftime('%H:%M:%S')
-        
-        print(f'\nThe current bus plan does not correspond to the timetable in the following rows:')
-        for i in range(len(dfc)):
-            if not dfc['start time'].iloc[i] in table['departure_time'].values:
-                print(f"\nRow {i}   The start time {dfc['start time'].iloc[i]} does not correspond to {table['departure_time'].iloc[i]} in the timetable.")
+        joined = plan_trips.merge(timetable_trips, on=TRIP_KEYS, how='outer', indicator=True, sort=False)
+        joined['deviation_seconds'] = 0
+
+    def part(side, columns, order):
+        return (joined.loc[joined['_merge'] == side, columns]
+                .astype({column: int for column in columns if column.endswith(('_row', 'deviation_seconds'))})
+                .sort_values(order)
+                .reset_index(drop=True))
+
+    matched = part('both', ['plan_row', 'timetable_row'] + TRIP_KEYS + ['deviation_seconds'], 'plan_row')
+
+    # How many service trips drive each timetable trip
+    times_driven = joined.loc[joined['_merge'] == 'both', 'trip_id'].value_counts()
+    duplicated = (timetable_trips[timetable_trips['trip_id'].isin(times_driven.index[times_driven > 1])]
+                  .assign(times_driven=lambda trips: trips['trip_id'].map(times_driven))
+                  .drop(columns='trip_id')
+                  .reset_index(drop=True))
+
+    return TimetableComparison(
+        matched=matched,
+        missing=part('right_only', ['timetable_row'] + TRIP_KEYS, 'timetable_row'),
+        unplanned=part('left_only', ['plan_row'] + TRIP_KEYS, 'plan_row'),
+        duplicated=duplicated,
+        unreadable=unreadable,
+    )
     
-def Energy_Checker(df_filled):
+def soc_trajectory(df_filled, vehicle=DEFAULT_VEHICLE):
+    """
+    Calculates the state of charge of every bus after every activity in one pass
+    Every bus starts at the maximum battery level, the grouped cumulative sum of the
+    energy consumption is subtracted from it
+    param df_filled: the dataset filled with idles
+    param vehicle: the VehicleModel or Fleet with the battery of every bus
+    return: DataFrame with one row per activity, sorted per bus, with the battery level
+            after the activity ('soc' in kWh, 'soc_percentage'), 'below_min' and the
+            soh, min_level and charge_power of the bus
+    """
+    # The selection is a new frame, the kWh are summed in float64 so the float32 storage does not add up rounding
+    trajectory = df_filled[["bus", "start_seconds", "end_seconds", "activity", "energy consumption"]].astype(
+        {"bus": int, "energy consumption": float})
+    trajectory["energy consumption"] = trajectory["energy consumption"].fillna(0.0)
+    # stable sort, so the activities of a bus stay in the order of the planning
+    trajectory = trajectory.sort_values("bus", kind="stable")
+
+    # Every row gets the battery of its own bus type, so a mixed fleet is calculated in the same pass
+    model = as_fleet(vehicle).columns(trajectory["bus"], ["soh", "min_level", "max_level", "charge_power"])
+    soh = model["soh"].to_numpy()
+    used = trajectory.groupby("bus", sort=False)["energy consumption"].cumsum()
+    trajectory["soc"] = model["max_level"].to_numpy() * soh - used
+    trajectory["soc_percentage"] = trajectory["soc"] / soh * 100
+    trajectory["below_min"] = trajectory["soc"] < model["min_level"].to_numpy() * soh
+    trajectory["soh"] = soh
+    trajectory["min_level"] = model["min_level"].to_numpy()
+    trajectory["charge_power"] = model["charge_power"].to_numpy()
+
+    return trajectory
+
+
+# Points of the charge curve lookup tables, and the power at a full battery as a fraction of charge_power
+CHARGE_TABLE_POINTS = 2001
+CV_MIN_POWER = 0.05
+
+
+def charge_tables(models, points=CHARGE_TABLE_POINTS):
+    """
+    Precomputes the CC-CV charge curve of every vehicle model as two lookup tables on an even grid
+    Up to cv_level the charger gives charge_power, above it the power goes down linearly with the
+    battery level to CV_MIN_POWER * charge_power at a full battery
+    param models: list of VehicleModel
+    param points: the amount of points per table
+    return: (hours, levels, full_hours) with hours (models, points) the time to charge from 0 to every level of
+            np.linspace(0, 1, points), levels (models, points) the level after every time of
+            np.linspace(0, full_hours, points), and full_hours the time to charge from 0 to full per model
+    """
+    grid = np.linspace(0, 1, points)
+    hours = np.empty((len(models), points))
+    levels = np.empty((len(models), points))
+    for i, model in enumerate(models):
+        taper = np.maximum((1 - grid) / max(1 - model.cv_level, 1e-9), CV_MIN_POWER)
+        power = model.charge_power * np.where(grid <= model.cv_level, 1.0, taper)
+        per_level = model.soh / power
+        hours[i] = np.r_[0.0, np.cumsum((per_level[1:] + per_level[:-1]) / 2 * np.diff(grid))]
+        levels[i] = np.interp(np.linspace(0, hours[i, -1], points), hours[i], grid)
+    return hours, levels, hours[:, -1].copy()
+
+
+def lookup(table, rows, x, step):
+    """
+    Reads table[rows] at x by linear interpolation, the table has a value every step from 0
+    """
+    position = np.clip(x / step, 0, table.shape[1] - 1)
+    low = np.minimum(position.astype(np.int64), table.shape[1] - 2)
+    fraction = position - low
+    return table[rows, low] * (1 - fraction) + table[rows, low + 1] * fraction
+
+
+def simulate_charging(df_filled, vehicle=DEFAULT_VEHICLE):
+    """
+    Calculates the state of charge of every bus like soc_trajectory, but the charged energy follows from
+    the duration of the charging activity and the CC-CV charge curve and the battery never gets above max_level
+    The driving between two charging activities is one cumulative sum, the charging activities are scanned
+    in order: step k handles the k-th charging activity of all buses at once with the lookup tables
+    param df_filled: the dataset filled with idles
+    param vehicle: the VehicleModel or Fleet with the battery and charger of every bus
+    return: the trajectory of soc_trajectory where 'energy consumption' of a charging activity is the simulated
+            (negative) kWh, with charge_time (hours the charger delivers energy) and wasted_time (hours
+            at the charger with a battery at max_level)
+    """
+    trajectory = df_filled[["bus", "start_seconds", "end_seconds", "activity", "energy consumption"]].astype(
+        {"bus": int, "energy consumption": float})
+    trajectory["energy consumption"] = trajectory["energy consumption"].fillna(0.0)
+    trajectory = trajectory.sort_values("bus", kind="stable")
+
+    fleet = as_fleet(vehicle)
+    names = list(fleet.models)
+    model = fleet.columns(trajectory["bus"])
+    model_codes = pd.Categorical(model["name"], categories=names).codes
+    soh = model["soh"].to_numpy()
+    max_level = model["max_level"].to_numpy()
+    hours_table, level_table, full_hours = charge_tables([fleet.models[name] for name in names])
+
+    bus = trajectory["bus"].to_numpy()
+    n = len(bus)
+    hours = ((trajectory["end_seconds"] - trajectory["start_seconds"]) / 3600).to_numpy()
+    charging = (trajectory["activity"] == "charging").to_numpy()
+    consumption = np.where(charging, 0.0, trajectory["energy consumption"].to_numpy())
+
+    # Driven kWh per bus since its first activity, a charging activity adds nothing
+    block_start = np.flatnonzero(np.r_[True, bus[1:] != bus[:-1]]) if n else np.zeros(0, dtype=np.int64)
+    block_of_row = np.repeat(np.arange(len(block_start)), np.diff(np.r_[block_start, n]))
+    driven = np.cumsum(consumption)
+    driven -= np.r_[0.0, driven][block_start][block_of_row]
+
+    # Charging activities ordered on their number within the bus, so every step is one contiguous slice
+    rows = np.flatnonzero(charging)
+    blocks = block_of_row[rows]
+    first_of_block = np.r_[True, blocks[1:] != blocks[:-1]]
+    number = np.arange(len(rows)) - np.repeat(np.flatnonzero(first_of_block), np.diff(np.r_[np.flatnonzero(first_of_block), len(rows)]))
+    order = np.lexsort((blocks, number))
+    steps = np.searchsorted(number[order], np.arange(number.max() + 2 if len(rows) else 1))
+
+    # The battery level (fraction) after the last charging activity and the driven kWh at that moment, per bus
+    level_after = max_level[block_start].copy()
+    driven_after = np.zeros(len(block_start))
+    end_level = np.zeros(n)
+    charged = np.zeros(n)
+    wasted = np.zeros(n)
+    for k in range(len(steps) - 1):
+        step = rows[order[steps[k]:steps[k + 1]]]
+        block = block_of_row[step]
+        codes = model_codes[step]
+        arrival = np.clip(level_after[block] - (driven[step] - driven_after[block]) / soh[step], 0, 1)
+        hours_step = (full_hours / (hours_table.shape[1] - 1))[codes]
+        start_hours = lookup(hours_table, codes, arrival * (hours_table.shape[1] - 1), 1.0)
+        end_hours = np.minimum(start_hours + hours[step], full_hours[codes])
+        level = np.minimum(lookup(level_table, codes, end_hours, hours_step), max_level[step])
+        level = np.maximum(level, arrival)
+        ceiling_hours = lookup(hours_table, codes, max_level[step] * (hours_table.shape[1] - 1), 1.0)
+
+        end_level[step] = level
+        charged[step] = (level - arrival) * soh[step]
+        wasted[step] = np.clip(start_hours + hours[step] - np.maximum(ceiling_hours, start_hours), 0, hours[step])
+        level_after[block] = level
+        driven_after[block] = driven[step]
+
+    # Every activity starts from the last charging activity of its bus before it, or from the start of the day
+    last_charge = np.maximum.accumulate(np.where(charging, np.arange(n), -1)) if n else np.zeros(0, dtype=np.int64)
+    charged_before = last_charge >= block_start[block_of_row]
+    base_level = np.where(charged_before, end_level[last_charge], max_level)
+    base_driven = np.where(charged_before, driven[np.maximum(last_charge, 0)], 0.0)
+    level = base_level - (driven - base_driven) / soh
+
+    trajectory["energy consumption"] = np.where(charging, -charged, trajectory["energy consumption"].to_numpy())
+    trajectory["soc"] = level * soh
+    trajectory["soc_percentage"] = level * 100
+    trajectory["below_min"] = level < model["min_level"].to_numpy()
+    trajectory["soh"] = soh
+    trajectory["min_level"] = model["min_level"].to_numpy()
+    trajectory["charge_power"] = model["charge_power"].to_numpy()
+    trajectory["charge_time"] = np.where(charging, hours - wasted, 0.0)
+    trajectory["wasted_time"] = wasted
+    return trajectory
+
+
+@dataclass
+class EnergyResult:
+    """
+    Result of Energy_Checker
+    per_bus: DataFrame indexed by bus with the columns feasible, energy_used (kWh), min_soc (kWh),
+             min_soc_percentage, min_level (the minimum of its vehicle model), first_violation
+             (row where the battery drops below the minimum, <NA> if feasible), idle_time (hours)
+             and charge_time (hours)
+    total_energy, charge_time, idle_time: the totals of the whole fleet (kWh, hours, hours)
+    buses_used: the amount of buses in the plan
+    simulated: True if the charging was simulated, per_bus then also has charged_energy (kWh) and
+               wasted_time (hours at the charger with a full battery)
+    wasted_time: the wasted charger hours of the whole fleet, 0 if the charging was not simulated
+    """
+    per_bus: pd.DataFrame
+    total_energy: float
+    charge_time: float
+    idle_time: float
+    buses_used: int
+    simulated: bool = False
+    wasted_time: float = 0.0
+
+    @property
+    def feasible(self):
+        """
+        True if no bus drops below the minimum battery level
+        """
+        return bool(self.per_bus["feasible"].all())
+
+    def lines(self):
+        """
+        Returns the result as readable lines, one per bus and one per total
+        """
+        def hours_and_minutes(hours):
+            whole = int(hours)
+            return f"{whole} hours and {round((hours - whole) * 60)} minutes"
+
+        lines = []
+        for bus_id, bus in self.per_bus.iterrows():
+            if bus["feasible"]:
+                lines.append(f"Bus plan for Bus {bus_id} is feasible. Amount of energy used: {bus['energy_used']:.2f} kWh")
+            else:
+                lines.append(f"Bus {bus_id}: Battery level will drop below {bus['min_level']:.0%} during route {bus['first_violation']+1}. Route is infeasible.")
+
+        lines.append(f"Total Energy Used is: {round(self.total_energy,2)} kWh")
+        lines.append(f"Total Charge Time: {hours_and_minutes(self.charge_time)}")
+        lines.append(f"Total Idle Time: {hours_and_minutes(self.idle_time)}")
+        lines.append(f"Amount of Buses used: {self.buses_used}")
+        if self.simulated:
+            lines.append(f"Wasted Charger Time (battery full): {hours_and_minutes(self.wasted_time)}")
+        return lines
+
+
+def Energy_Checker(df_filled, vehicle=DEFAULT_VEHICLE, simulate=False):
     """
     calculates the total amount of energy used
     calculates the total idle time
     calculates total charge time
     shows feasibilty of the routes in terms of energy levels
     param df_filled: the dataset filled with idles
+    param vehicle: the VehicleModel or Fleet with the battery and charger of every bus
+    param simulate: simulate the charging with the charge curve and the max_level ceiling (simulate_charging)
+                    instead of using the charged kWh of the plan
+    return: EnergyResult with a record per bus and the totals of the fleet
+    """
+    if simulate:
+        trajectory = simulate_charging(df_filled, vehicle)
+    else:
+        trajectory = soc_trajectory(df_filled, vehicle)
+        trajectory["charge_time"] = -trajectory["energy consumption"].clip(upper=0) / trajectory["charge_power"]
+
+    consumption = trajectory["energy consumption"]
+    hours = (trajectory["end_seconds"] - trajectory["start_seconds"]) / 3600
+    per_bus = pd.DataFrame({
+        "energy_used": consumption.clip(lower=0),
+        "min_soc": trajectory["soc"],
+        "idle_time": hours.where(trajectory["activity"] == "idle", 0.0),
+        "charge_time": trajectory["charge_time"],
+        "charged_energy": -consumption.clip(upper=0),
+        "wasted_time": trajectory.get("wasted_time", 0.0),
+        "soh": trajectory["soh"],
+        "min_level": trajectory["min_level"],
+    }).groupby(trajectory["bus"], sort=False).agg(
+        {"energy_used": "sum", "min_soc": "min", "idle_time": "sum", "charge_time": "sum",
+         "charged_energy": "sum", "wasted_time": "sum", "soh": "first", "min_level": "first"})
+
+    # first activity of every bus where the battery level drops below the minimum
+    below = trajectory[trajectory["below_min"]]
+    first_violation = below.index.to_series().groupby(below["bus"].to_numpy(), sort=False).first()
+
+    per_bus["min_soc_percentage"] = per_bus["min_soc"] / per_bus["soh"] * 100
+    per_bus["first_violation"] = first_violation.reindex(per_bus.index).astype("Int64")
+    per_bus["feasible"] = per_bus["first_violation"].isna()
+    columns = ["feasible", "energy_used", "min_soc", "min_soc_percentage", "min_level",
+               "first_violation", "idle_time", "charge_time"]
+    per_bus = per_bus[columns + (["charged_energy", "wasted_time"] if simulate else [])]
+
+    return EnergyResult(
+        per_bus=per_bus,
+        total_energy=per_bus["energy_used"].sum(),
+        charge_time=per_bus["charge_time"].sum(),
+        idle_time=per_bus["idle_time"].sum(),
+        buses_used=len(per_bus),
+        simulated=simulate,
+        wasted_time=per_bus["wasted_time"].sum() if simulate else 0.0,
+    )
+
+def compute_kpis(df_filled, vehicle=DEFAULT_VEHICLE):
+    """
+    Calculates the summary numbers of a plan in one groupby on the activity
+    param df_filled: the dataset filled with idles
+    param vehicle: the VehicleModel or Fleet, the charging time uses the charge_power of every bus
+    return: dict with total_energy (kWh), charging_energy (kWh), charging_time (hours),
+            idle_time (hours), buses_used and per_line, a DataFrame with the trips,
+            hours and energy of the service trips per line
+    """
+    consumption = df_filled["energy consumption"].astype(float).fillna(0.0)
+    hours = (df_filled["end_seconds"] - df_filled["start_seconds"]) / 3600
+    charged = -consumption.clip(upper=0)
+
+    per_activity = pd.DataFrame({
+        "used": consumption.clip(lower=0),
+        "charged": charged,
+        "charge_hours": charged / as_fleet(vehicle).columns(df_filled["bus"], ["charge_power"])["charge_power"],
+        "hours": hours,
+    }).groupby(df_filled["activity"].to_numpy()).sum()
+
+    service = df_filled["activity"] == "service trip"
+    per_line = pd.DataFrame({
+        "trips": 1,
+        "hours": hours[service],
+        "energy": consumption[service],
+    }).groupby(pd.to_numeric(df_filled.loc[service, "line"], errors="coerce").astype("Int64")).sum()
+
+    return {
+        "total_energy": per_activity["used"].sum(),
+        "charging_energy": per_activity["charged"].sum(),
+        "charging_time": per_activity["charge_hours"].sum(),
+        "idle_time": per_activity["hours"].get("idle", 0.0),
+        "buses_used": df_filled["bus"].nunique(),
+        "per_line": per_line,
+    }
+
+
+# Battery sizes of the sensitivity sweep, from a new battery down to a worn one (kWh)
+SENSITIVITY_SOH = tuple(range(255, 179, -5))
+
+
+def max_energy_used(consumption, hours, charging, block_starts, charge_powers):
+    """
+    Calculates for every bus the most energy it has used since the start, for every charging speed at once
+    A charger that is slower than the plan assumes charges at most charge_power * hours in a charging row
+    param consumption, hours, charging: kWh, duration and 'is charging' of every row, sorted per bus
+    param block_starts: the position of the first row of every bus
+    param charge_powers: the charging speeds in kW, or an array (rows, 1) with the charging speed of the bus of every row
+    return: array (buses, charging speeds) of kWh
+    """
+    charge_powers = np.asarray(charge_powers, dtype=float)
+    if charge_powers.ndim == 1:
+        charge_powers = charge_powers[None, :]
+    energy = np.where(charging[:, None], np.maximum(consumption[:, None], -charge_powers * hours[:, None]),
+                      consumption[:, None])
+    used = np.cumsum(energy, axis=0)
+    # Every bus starts at 0, the cumulative sum of the buses before it is removed
+    before = np.vstack([np.zeros((1, energy.shape[1])), used[block_starts[1:] - 1]])
+    used -= np.repeat(before, np.diff(np.r_[block_starts, len(used)]), axis=0)
+    return np.maximum.reduceat(used, block_starts, axis=0)
+
+
+@dataclass
+class SensitivityResult:
+    """
+    Result of Energy_Sensitivity
+    buses: the buses
+    soh, min_level, charge_power: the values of the parameter grid, NaN where every bus uses the value of its own
+                                  vehicle model and those are not all the same
+    feasible: bool array (buses, soh, min_level, charge_power), True if the bus stays above the minimum
+    max_used: array (buses, charge_power) with the most kWh a bus uses since the start of the plan
+    """
+    buses: pd.Index
+    soh: np.ndarray
+    min_level: np.ndarray
+    charge_power: np.ndarray
+    feasible: np.ndarray
+    max_used: np.ndarray
+
+    def per_bus(self, min_level=None, charge_power=None):
+        """
+        Returns the feasibility matrix of every bus against the soh for one min_level and charge_power
+        (default the first values of the grid), as a DataFrame with a row per bus and a column per soh
+        """
+        i = 0 if min_level is None else int(np.flatnonzero(np.isclose(self.min_level, min_level))[0])
+        j = 0 if charge_power is None else int(np.flatnonzero(np.isclose(self.charge_power, charge_power))[0])
+        return pd.DataFrame(self.feasible[:, :, i, j], index=self.buses,
+                            columns=pd.Index(self.soh, name="soh"))
 
+    def table(self):
+        """
+        Returns one row per point of the grid with the amount of feasible buses and if the whole plan is feasible
+        """
+        grid = pd.MultiIndex.from_product([self.soh, self.min_level, self.charge_power],
+                                          names=["soh", "min_level", "charge_power"])
+        feasible_buses = self.feasible.sum(axis=0).ravel()
+        return pd.DataFrame({"feasible_buses": feasible_buses,
+                             "plan_feasible": feasible_buses == len(self.buses)}, index=grid).reset_index()
+
+    def lines(self):
+        """
+        Returns the smallest battery where the plan is still feasible, one line per min_level and charge_power
+        """
+        plan = self.feasible.all(axis=0)
+        lines = []
+        for i, min_level in enumerate(self.min_level):
+            for j, charge_power in enumerate(self.charge_power):
+                feasible = self.soh[plan[:, i, j]]
+                minimum = "the minimum of each bus model" if np.isnan(min_level) else f"a minimum {min_level:.0%}"
+                speed = "the speed of each bus model" if np.isnan(charge_power) else f"{charge_power:g} kW"
+                setting = f"{minimum}, charging at {speed}"
+                if len(feasible):
+                    lines.append(f"With {setting} the plan is feasible down to {feasible.min():g} kWh.")
+                else:
+                    lines.append(f"With {setting} the plan is not feasible for any battery of the sweep.")
+        return lines
+
+
+def Energy_Sensitivity(df_filled, soh=SENSITIVITY_SOH, min_level=None, charge_power=None, vehicle=DEFAULT_VEHICLE,
+                       workers=None):
     """
+    Checks the energy feasibility of every bus for a whole grid of battery sizes, minimum levels and charging speeds
+    The cumulative consumption per bus is calculated once per charging speed, its maximum is then broadcast
+    against the soh and min_level of the grid, so the grid costs almost nothing extra
+    Without min_level and charge_power every bus uses the values of its own vehicle model, also in a mixed fleet,
+    so for the soh of the model the result is the same as Energy_Checker
+    param df_filled: the dataset filled with idles
+    param soh: the battery sizes in kWh
+    param min_level: the minimum battery levels as a fraction of the soh, default the one of the model of every bus
+    param charge_power: the charging speeds in kW, default the one of the model of every bus
+    param vehicle: the VehicleModel or Fleet, its max_level is the battery level at the start
+    param workers: amount of processes that each get a part of the buses, None calculates everything here
+    return: SensitivityResult
+    """
+    fleet = as_fleet(vehicle)
+    own_min_level, own_charge_power = min_level is None, charge_power is None
+    soh = np.asarray(soh, dtype=float)
+
+    trajectory = df_filled[["bus", "start_seconds", "end_seconds", "activity", "energy consumption"]].astype(
+        {"bus": int, "energy consumption": float})
+    trajectory = trajectory.sort_values("bus", kind="stable")
+    bus = trajectory["bus"].to_numpy()
+    consumption = trajectory["energy consumption"].fillna(0.0).to_numpy()
+    hours = ((trajectory["end_seconds"] - trajectory["start_seconds"]) / 3600).to_numpy()
+    charging = (trajectory["activity"] == "charging").to_numpy()
+    block_starts = np.flatnonzero(np.r_[True, bus[1:] != bus[:-1]]) if len(bus) else np.zeros(0, dtype=int)
+    buses = pd.Index(bus[block_starts], name="bus")
+
+    model = fleet.columns(pd.Series(buses), ["max_level", "min_level", "charge_power"])
+    max_level = model["max_level"].to_numpy()
+
+    def grid_value(per_bus):
+        # The grid shows the value of the models if all buses have the same, otherwise NaN
+        values = np.unique(per_bus)
+        return np.array([values[0] if len(values) == 1 else np.nan])
+
+    if own_min_level:
+        # (buses, 1): every bus its own minimum
+        bus_min_level = model["min_level"].to_numpy()[:, None]
+        min_level = grid_value(bus_min_level) if len(buses) else np.array([fleet.models[fleet.default].min_level])
+    else:
+        min_level = np.asarray(min_level, dtype=float)
+        bus_min_level = min_level[None, :]
+    if own_charge_power:
+        # (rows, 1): every row the charging speed of its bus
+        charge_power_per_bus = model["charge_power"].to_numpy()
+        row_charge_power = np.repeat(charge_power_per_bus, np.diff(np.r_[block_starts, len(bus)]))[:, None]
+        charge_power = (grid_value(charge_power_per_bus) if len(buses)
+                        else np.array([fleet.models[fleet.default].charge_power]))
+    else:
+        charge_power = np.asarray(charge_power, dtype=float)
+        row_charge_power = charge_power
 
-    soh = 255
-    min_battery_level = 0.1 * soh
-    max_battery_level = 0.9 * soh
-    total_charge_time = 0
-    total_idle_time = 0
-    charge_per_hour = 450
+    def row_part(first, last):
+        return row_charge_power[first:last] if own_charge_power else row_charge_power
 
-    total_energy_used = 0
+    if len(bus) == 0:
+        max_used = np.zeros((0, len(charge_power)))
+    elif workers is None or workers <= 1:
+        max_used = max_energy_used(consumption, hours, charging, block_starts, row_charge_power)
+    else:
+        # Every process gets whole buses, so the cumulative sums do not cross a shard
+        shards = [block for block in np.array_split(np.arange(len(block_starts)), workers) if len(block)]
+        bounds = [(block_starts[block[0]], block_starts[block[-1] + 1] if block[-1] + 1 < len(block_starts) else len(bus))
+                  for block in shards]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = pool.map(max_energy_used,
+                             [consumption[first:last] for first, last in bounds],
+                             [hours[first:last] for first, last in bounds],
+                             [charging[first:last] for first, last in bounds],
+                             [block_starts[block] - first for block, (first, _) in zip(shards, bounds)],
+                             [row_part(first, last) for first, last in bounds])
+            max_used = np.vstack(list(parts))
+
+    # (buses, soh, min_level, charge_power): the usable energy against the most energy the bus uses
+    usable = (max_level[:, None, None, None] - bus_min_level[:, None, :, None]) * soh[None, :, None, None]
+    feasible = max_used[:, None, None, :] <= usable
+
+    return SensitivityResult(buses=buses, soh=soh, min_level=min_level, charge_power=charge_power,
+                             feasible=feasible, max_used=max_used)
+
+
+def sweep_line(keys, starts, ends, weights=None):
+    """
+    Sums intervals that are active at the same time, separately per key
+    Every interval adds its weight at its start and removes it at its end, all events are sorted once
+    (ends before starts at the same time) and a cumulative sum gives the level after every event
+    param keys: integer key per interval, for example the code of the location
+    param starts, ends: start and end per interval in seconds
+    param weights: weight per interval, default 1 so the level is the amount of active intervals
+    return: (keys, times, levels) with one value per distinct key and time where the level changes,
+            the level holds until the next time of the same key and is 0 after the last one
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    weights = np.ones(len(keys), dtype=np.int64) if weights is None else np.asarray(weights)
+    if len(keys) == 0:
+        return keys, starts, weights
 
-    df_filled['bus'] = df_filled['bus'].astype(int)
-    df_filled = df_filled.sort_values('bus')
-    group_bus = df_filled.groupby('bus', observed=False)
+    event_keys = np.concatenate([keys, keys])
+    event_times = np.concatenate([starts, ends])
+    is_start = np.concatenate([np.ones(len(keys), dtype=bool), np.zeros(len(keys), dtype=bool)])
+    deltas = np.concatenate([weights, -weights])
 
-    messages = []
+    order = np.lexsort((is_start, event_times, event_keys))
+    event_keys, event_times, deltas = event_keys[order], event_times[order], deltas[order]
+    levels = np.cumsum(deltas)
 
-    for bus_id, bus_routes in group_bus:
-        total_energy_used_on_route = 0
-        total_charge_time_on_route = 0
-        current_battery_level = max_battery_level
-        idle_per_route = 0
+    # Every key starts at 0, the rounding of float weights of earlier keys is removed
+    new_key = np.r_[True, event_keys[1:] != event_keys[:-1]]
+    before_key = np.r_[0, levels[:-1]][new_key]
+    levels = levels - np.repeat(before_key, np.diff(np.r_[np.flatnonzero(new_key), len(levels)]))
 
-        feasible = True
+    # Only the level after the last event of every time counts
+    last = np.r_[(event_keys[1:] != event_keys[:-1]) | (event_times[1:] != event_times[:-1]), True]
+    return event_keys[last], event_times[last], levels[last]
 
-        for route_index, route in bus_routes.iterrows():
-            energy_consumption = route["energy consumption"]
 
-            if current_battery_level - energy_consumption < min_battery_level:
-                feasible = False
+# Amount of chargers per location, None is no limit: the depot size is not known, so only the peak is reported
+CHARGERS = None
 
-            if route.get("activity", "") == 'idle':
-                idle_period = (route["end_seconds"] - route["start_seconds"]) / 3600
-                idle_per_route += idle_period
 
-            if energy_consumption > 0:
-                total_energy_used_on_route += energy_consumption
-            else:
-                total_charge_time_on_route += (energy_consumption / charge_per_hour)
+@dataclass
+class ChargerResult:
+    """
+    Result of Charger_Checker
+    profile: DataFrame with location, seconds and chargers_in_use, one row per moment the amount
+             of charging buses at a location changes
+    peak: the most buses that charge at once per location
+    windows: DataFrame with location, start_seconds, end_seconds and chargers_in_use (the most in the window),
+             one row per time window where more buses charge than there are chargers
+    chargers: the amount of chargers per location, None if there is no limit
+    """
+    profile: pd.DataFrame
+    peak: pd.Series
+    windows: pd.DataFrame
+    chargers: dict
 
-            current_battery_level -= energy_consumption
+    @property
+    def feasible(self):
+        """
+        True if there are never more buses charging than chargers at any location
+        """
+        return self.windows.empty
 
-        total_energy_used += total_energy_used_on_route
-        total_charge_time += total_charge_time_on_route
-        total_idle_time += idle_per_route
+    def lines(self):
+        """
+        Returns the result as readable lines, one per location and one per window with too many buses
+        """
+        if self.peak.empty:
+            return ["No bus charges in this plan."]
+        lines = [f"At most {peak} buses charge at once at {location} "
+                 + ("(no limit)." if self.chargers[location] is None else f"({self.chargers[location]} chargers).")
+                 for location, peak in self.peak.items()]
+
+        multi_day = bool((self.windows["end_seconds"] >= 24 * 3600).any())
+        def clock(seconds):
+            times = seconds_to_time(seconds)
+            if multi_day:
+                times = 'day ' + (seconds // (24 * 3600) + 1).astype(int).astype(str) + ' ' + times
+            return times
+
+        for location, start, end, in_use in zip(self.windows["location"], clock(self.windows["start_seconds"]),
+                                                 clock(self.windows["end_seconds"]), self.windows["chargers_in_use"]):
+            lines.append(f"{location} from {start} to {end}: {in_use} buses charge at once, "
+                         f"there are {self.chargers[location]} chargers.")
+        return lines
+
+
+def Charger_Checker(df_filled, chargers=CHARGERS):
+    """
+    Checks that no more buses charge at once than there are chargers, per location for the whole fleet
+    All charging activities go through one sweep line, so a plan of many days and buses stays fast
+    param df_filled: the PlanFrame made by change_data
+    param chargers: the amount of chargers at every location, or a dict with the amount per location,
+                    None or locations that are not in the dict have no limit
+    return: ChargerResult with the charger profile, the peak per location and the windows with too many buses
+
+    Example with a different limit per location, only the window at ehvapt is too busy:
+    >>> plan = pd.DataFrame({"activity": "charging", "start location": ["ehvapt"] * 2 + ["ehvgar"] * 5,
+    ...                      "start_seconds": [30600] * 2 + [36000] * 5, "end_seconds": [32400] * 2 + [39600] * 5})
+    >>> Charger_Checker(plan, {"ehvapt": 1, "ehvgar": 10}).windows.to_dict("records")
+    [{'location': 'ehvapt', 'start_seconds': 30600, 'end_seconds': 32400, 'chargers_in_use': 2}]
+    """
+    charging = df_filled[(df_filled["activity"] == "charging")
+                         & (df_filled["end_seconds"] > df_filled["start_seconds"])]
+    locations = pd.Categorical(normalize_locations(charging["start location"]))
+    names = locations.categories
+
+    keys, times, levels = sweep_line(locations.codes, charging["start_seconds"], charging["end_seconds"])
+    profile = pd.DataFrame({
+        "location": names.take(keys),
+        "seconds": times,
+        "chargers_in_use": levels,
+    })
+    peak = profile.groupby("location", sort=True)["chargers_in_use"].max()
+
+    if isinstance(chargers, dict):
+        limits = {name: chargers.get(name) for name in names}
+    else:
+        limits = {name: chargers for name in names}
+    capacity = np.array([np.inf if limits[name] is None else limits[name] for name in names], dtype=float)[keys]
 
+    # A window runs from the first moment with too many buses until the level drops again, the
+    # sweep always ends at 0 per location so there is always a next moment of the same location
+    over = levels > capacity
+    begin = np.flatnonzero(over & ~np.r_[False, over[:-1]])
+    stop = np.flatnonzero(over & ~np.r_[over[1:], False])
+    # The most buses over [begin, stop] of every window, every other slice of reduceat lies between two windows
+    bounds = np.ravel(np.column_stack([begin, stop + 1]))
+    window_max = np.maximum.reduceat(np.r_[levels, 0], bounds)[::2] if len(begin) else levels[:0]
+    windows = pd.DataFrame({
+        "location": names.take(keys[begin]),
+        "start_seconds": times[begin],
+        "end_seconds": times[stop + 1],
+        "chargers_in_use": window_max,
+    })
 
+    return ChargerResult(profile=profile, peak=peak, windows=windows, chargers=limits)
 
-        if feasible:
-            messages.append(f"Bus plan for Bus {bus_id} is feasible. Amount of energy used: {total_energy_used_on_route:.2f} kWh")
-        
-        if feasible == False:
-            messages.append(f"Bus {bus_id}: Battery level will drop below 10% during route {route_index+1}. Route is infeasible.")
 
-    charge_hours = round(total_charge_time)
-    charge_minutes = round((total_charge_time - charge_hours) * 60)
-    idle_hours = round(total_idle_time)
-    idle_minutes = round((total_idle_time - idle_hours) * 60)
+# Hours of the day of every tariff window of the grid connection: (name, from hour, until hour)
+TARIFF_WINDOWS = (("off-peak", 0, 7), ("peak", 7, 23), ("off-peak", 23, 24))
 
-    messages.append(f"Total Energy Used is: {round(total_energy_used,2)} kWh")
-    messages.append(f"Total Charge Time: {abs(charge_hours)} hours and {abs(charge_minutes)} minutes")
-    messages.append(f"Total Idle Time: {idle_hours} hours and {idle_minutes} minutes")
-    messages.append(f"Amount of Buses used: {bus_id}")
 
+@dataclass
+class GridLoad:
+    """
+    Result of grid_load
+    profile: DataFrame with seconds (the start of every minute) and kw, the average charging power in that minute
+    peak_kw, peak_seconds: the highest power and the minute where it is reached
+    energy: the charged energy in kWh
+    per_tariff: the charged energy in kWh per tariff window
+    """
+    profile: pd.DataFrame
+    peak_kw: float
+    peak_seconds: int
+    energy: float
+    per_tariff: pd.Series
+
+    @property
+    def duration_curve(self):
+        """
+        The load-duration curve: the power of every minute from high to low
+        """
+        return np.sort(self.profile["kw"].to_numpy())[::-1]
 
+    def lines(self):
+        """
+        Returns the result as readable lines
+        """
+        if self.profile.empty:
+            return ["No bus charges in this plan."]
+        day = self.peak_seconds // (24 * 3600)
+        peak_time = seconds_to_time([self.peak_seconds]).iloc[0][:5]
+        lines = [f"Peak grid load: {self.peak_kw:.0f} kW at {peak_time}" + (f" on day {day + 1}" if day else ""),
+                 f"Charged energy: {self.energy:.2f} kWh"]
+        for name, energy in self.per_tariff.items():
+            lines.append(f"Charged in the {name} window: {energy:.2f} kWh")
+        curve = self.duration_curve
+        lines.append(f"Above half of the peak for {(curve > self.peak_kw / 2).sum() / 60:.1f} hours")
+        return lines
+
+
+def grid_load(df_filled, location=None, tariffs=TARIFF_WINDOWS):
+    """
+    Makes the grid-load profile of the chargers per minute
+    Every charging activity draws its charged kWh evenly over its duration, one sweep line gives the total
+    power between all start and end events and its cumulative sum the energy, the energy at every
+    whole minute then gives the average power per minute exactly
+    param df_filled: the PlanFrame made by change_data
+    param location: only the chargers at this location (for example 'ehvgar'), None for all locations
+    param tariffs: the tariff windows as (name, from hour, until hour)
+    return: GridLoad with the profile per minute, the peak, the energy per tariff window and the load-duration curve
+    """
+    charging = df_filled[(df_filled["activity"] == "charging")
+                         & (df_filled["end_seconds"] > df_filled["start_seconds"])]
+    if location is not None:
+        charging = charging[normalize_locations(charging["start location"]) == str(location).strip().lower()]
+    if charging.empty:
+        return GridLoad(pd.DataFrame({"seconds": np.zeros(0, dtype=np.int64), "kw": np.zeros(0)}),
+                        0.0, 0, 0.0, pd.Series(dtype=float))
+
+    starts = charging["start_seconds"].to_numpy(dtype=np.int64)
+    ends = charging["end_seconds"].to_numpy(dtype=np.int64)
+    charged = -charging["energy consumption"].astype(float).fillna(0.0).to_numpy()
+    power = np.clip(charged / ((ends - starts) / 3600), 0, None)
+
+    _, times, levels = sweep_line(np.zeros(len(starts), dtype=np.int64), starts, ends, power)
+    # Energy in kW seconds since the first event, it grows linearly between two events
+    energy = np.r_[0.0, np.cumsum(levels[:-1] * np.diff(times))]
+    minutes = np.arange(times[0] // 60 * 60, -(-times[-1] // 60) * 60 + 1, 60)
+    kw = np.diff(np.interp(minutes, times, energy)) / 60
+    minutes = minutes[:-1]
+
+    names = np.empty(24, dtype=object)
+    for name, first, last in tariffs:
+        names[first:last] = name
+    per_tariff = pd.Series(kw / 60).groupby(names[minutes % (24 * 3600) // 3600], sort=False).sum()
+
+    peak = int(np.argmax(kw))
+    return GridLoad(
+        profile=pd.DataFrame({"seconds": minutes, "kw": kw}),
+        peak_kw=float(kw[peak]),
+        peak_seconds=int(minutes[peak]),
+        energy=float(kw.sum() / 60),
+        per_tariff=per_tariff,
+    )
+
+
+def plot_grid_load(grid, df_filled):
+    """
+    Plots the grid load on the same time axis as the Gantt chart, with the load-duration curve next to it
+    param grid: the GridLoad of grid_load
+    param df_filled: the PlanFrame the GridLoad was made of, used for the time axis
+    return: the figure, it is not saved or shown
+    """
+    fig, (ax, curve_ax) = plt.subplots(1, 2, figsize=(12, 3), gridspec_kw={"width_ratios": [3, 1]})
+
+    profile = grid.profile
+    ax.fill_between(profile["seconds"] - plan_day_boundary(df_filled), profile["kw"], step="post", color="tab:red", alpha=0.6)
+    ax.axhline(grid.peak_kw, color="black", linestyle="--", linewidth=0.8)
+    time_axis(ax, df_filled)
+    ax.set_ylabel("Grid load (kW)")
+    ax.set_title(f"Charging power, peak {grid.peak_kw:.0f} kW")
+
+    curve = grid.duration_curve
+    curve_ax.plot(np.arange(len(curve)) / 60, curve, color="tab:red")
+    curve_ax.set_xlabel("Hours")
+    curve_ax.set_ylabel("kW")
+    curve_ax.set_title("Load-duration curve")
+    curve_ax.grid(linestyle="--", alpha=0.5)
+
+    fig.tight_layout()
+    return fig
+
+
+def plan_day_boundary(df_filled):
+    """
+    Gives the day boundary that df_filled was made with, the difference of start_seconds and start_shifted
+    param df_filled: the PlanFrame made by change_data
+    return: the day boundary in seconds, DAY_BOUNDARY for an empty plan
+    """
+    if not len(df_filled):
+        return DAY_BOUNDARY
+    return int(df_filled["start_seconds"].iloc[0]) - int(df_filled["start_shifted"].iloc[0])
+
+
+def hour_label(seconds):
+    """
+    Gives a time of day in seconds as HH:MM, without the seconds
+    """
+    return f"{seconds // 3600 % 24:02d}:{seconds % 3600 // 60:02d}"
+
+
+def time_axis(ax, df_filled):
+    """
+    Sets the x axis of a chart in seconds since the day boundary of the first service day, like the Gantt chart
+    24 hours from the day boundary for one day, a tick per day for a plan of more days
+    param ax: the matplotlib axis
+    param df_filled: the PlanFrame made by change_data
+    return: the amount of service days
+    """
+    boundary = plan_day_boundary(df_filled)
+    days = int(df_filled["service_day"].max()) + 1 if len(df_filled) else 1
+    if days == 1:
+        xticks = range(0, 24 * 3600 + 1, 3600)
+        xlabels = [hour_label(t + boundary) for t in xticks]
+        ax.set_xlabel("Time")
+    else:
+        # One tick at the day boundary of every service day, for a month only every few days
+        first_rows = df_filled.drop_duplicates("service_day").sort_values("service_day")
+        if "date" in first_rows.columns:
+            names = parse_dates(first_rows["date"].astype(object)).dt.strftime("%a %d-%m").tolist()
+        else:
+            names = [f"Day {day + 1}" for day in first_rows["service_day"]]
+        label = dict(zip(first_rows["service_day"], names))
+        step = max(1, -(-days // 14))
+        xticks = range(0, days * 24 * 3600, step * 24 * 3600)
+        xlabels = [label.get(t // (24 * 3600), "") for t in xticks]
+        ax.set_xlabel(f"Service day (from {hour_label(boundary)})")
+    ax.set_xticks(xticks)
+    ax.set_xticklabels(xlabels)
+    # A ride that crosses the day boundary of the last day is drawn up to its end
+    last_end = int(df_filled["end_shifted"].max()) if len(df_filled) else 0
+    ax.set_xlim(0, max(days * 24 * 3600, last_end))
+    return days
 
 
-    return messages
 def plot_gantt_chart(df_filled):
 
     """
     Plots the Gantt chart
-    Sets the axis to 04:00-02:00 the next day
+    Sets the axis to 24 hours from the day boundary, for a plan of more days from the day boundary
+    of the first day until the day boundary after the last day with a tick per day
     gives each activity an unique color
+    All bars of one activity are drawn as one PolyCollection, so big plannings stay fast to draw
     param df_filled: the data set filled with idle and no gaps
+    return: the figure, it is not saved or shown
     """
     activities = df_filled["activity"].unique()
     colours = plt.cm.tab20.colors
     colour_per_activity = {type: colours[i % len(colours)] for i, type in enumerate(activities)}
 
     fig, ax = plt.subplots(figsize=(12, 5))
-    for _, row in df_filled.iterrows():
-        ax.barh(
-            row["bus"],
-            left=row["start_shifted"],
-            width=row["end_shifted"] - row["start_shifted"],
-            color=colour_per_activity[row["activity"]],
-            edgecolor="black",
+
+    bus = df_filled["bus"].astype(float).to_numpy()
+    left = df_filled["start_shifted"].to_numpy(dtype=float)
+    right = df_filled["end_shifted"].to_numpy(dtype=float)
+    activity = df_filled["activity"].to_numpy()
+    for type in activities:
+        rows = activity == type
+        # One rectangle per row with the same height as a default barh bar
+        bottom, top = bus[rows] - 0.4, bus[rows] + 0.4
+        corners = np.stack([
+            np.column_stack([left[rows], bottom]),
+            np.column_stack([left[rows], top]),
+            np.column_stack([right[rows], top]),
+            np.column_stack([right[rows], bottom]),
+        ], axis=1)
+        ax.add_collection(PolyCollection(
+            corners,
+            facecolors=colour_per_activity[type],
+            edgecolors="black",
             alpha=0.7,
-        )
+        ))
+    ax.autoscale_view()
 
     patches = [plt.Rectangle((0, 0), 1, 1, fc=colour_per_activity[type]) for type in activities]
     ax.legend(patches, activities, loc="upper right")
 
-    xticks = range(0, 22 * 3600 + 1, 3600)
-    xlabels = [f"{(t // 3600 + 4) % 24:02d}:00" for t in xticks]
-    ax.set_xticks(xticks)
-    ax.set_xticklabels(xlabels)
-    ax.set_xlim(0, 22 * 3600)
-    ax.set_xlabel("Time")
+    days = time_axis(ax, df_filled)
     ax.set_ylabel("Bus number")
-    ax.set_title("Bus Planning lines 400 and 401 for 1 day")
+    ax.set_title(f"Bus Planning lines 400 and 401 for {days} day" + ("s" if days > 1 else ""))
 
     bus_labels = sorted(df_filled["bus"].unique())
-    ax.set_yticks(bus_labels)
-    ax.set_yticklabels([str(b) for b in bus_labels])
+    if len(bus_labels) <= 40:
+        ax.set_yticks(bus_labels)
+        ax.set_yticklabels([str(b) for b in bus_labels])
+    else:
+        # A label for every bus is unreadable and makes drawing slow for a big fleet
+        ax.yaxis.set_major_locator(MaxNLocator(integer=True))
 
-    plt.tight_layout()
-    plt.savefig('Bus Planning Gantt Chart.png')
-    plt.show()
+    fig.tight_layout()
+    return fig
+
+
+def export_pdf(gantt_fig, overlaps, energy, continuity=None, chargers=None, grid_fig=None):
+    """
+    Makes a PDF with the Gantt chart on the first page and the overlap and energy results on the second
+    param gantt_fig: the figure of plot_gantt_chart
+    param grid_fig: the figure of plot_grid_load (or None), it is put right after the Gantt chart
+    param overlaps: the result of Overlap_Checker (or None)
+    param energy: the EnergyResult of Energy_Checker (or None)
+    param continuity: the result of Continuity_Checker (or None)
+    param chargers: the ChargerResult of Charger_Checker (or None)
+    return: the bytes of the PDF
+    """
+    buf = BytesIO()
+    with PdfPages(buf) as pdf:
+        # First page: gantt chart
+        pdf.savefig(gantt_fig)
+        if grid_fig is not None:
+            pdf.savefig(grid_fig)
+        # Second page: overlaps, continuity and energy results
+        fig2, ax2 = plt.subplots(figsize=(8.27, 11.69))  # A4 size
+        ax2.axis("off")
+        text_lines = []
+        # Overlap
+        if overlaps:
+            text_lines.append("Overlaps found:")
+            for o in overlaps:
+                text_lines.append(str(o))
+        else:
+            text_lines.append("No overlaps found.")
+        # Location continuity
+        if continuity is not None:
+            text_lines.append("")
+            text_lines.append("Location continuity:")
+            text_lines.extend(continuity_lines(continuity))
+        # Energy
+        if energy is not None:
+            text_lines.append("")
+            text_lines.append("Energy-checker result:")
+            text_lines.extend(energy.lines())
+        # Chargers
+        if chargers is not None:
+            text_lines.append("")
+            text_lines.append("Charger occupancy:")
+            text_lines.extend(chargers.lines())
+        # write text to figure
+        ax2.text(0.01, 0.99, "\n".join(text_lines), va="top", wrap=True, fontsize=10)
+        pdf.savefig(fig2)
+        plt.close(fig2)
+    return buf.getvalue()
 
 
 def main():
     df, table = Data_Collection()
-    report_missing_data(df)
-
-    df_filled =change_data(df)
+    vehicle_file = input("Put your vehicle model JSON file in here (empty for the standard bus): ")
+    vehicle = load_fleet(vehicle_file) if vehicle_file else DEFAULT_VEHICLE
+    report = report_missing_data(df)
+    print("\n--- Data Quality ---")
+    for line in report.lines():
+        print(line)
+
+    df_filled =change_data(df, vehicle=vehicle)
     df_filled.to_excel("BusPlanning_filled.xlsx", index=False)
     
-    Overlap_Checker(df_filled)     
+    trips = sort_trips(df_filled)
+    Overlap_Checker(df_filled, trips)
+
+    print("\n--- Location Continuity Results ---")
+    for line in continuity_lines(Continuity_Checker(df_filled, trips)):
+        print(line)
     
-    Timetable_comparison(df_filled, table)
+    comparison = Timetable_comparison(df_filled, table)
+    print("\n--- Timetable Comparison Results ---")
+    for line in comparison.lines():
+        print(line)
     
-    messages = Energy_Checker(df_filled)
+    energy = Energy_Checker(df_filled, vehicle)
     print("\n--- Energy Checker Results ---")
-    for msg in messages:
-        print(msg)
+    for line in energy.lines():
+        print(line)
+
+    print("\n--- Charging Simulation Results ---")
+    for line in Energy_Checker(df_filled, vehicle, simulate=True).lines():
+        print(line)
+
+    print("\n--- Battery Sensitivity Results ---")
+    for line in Energy_Sensitivity(df_filled, vehicle=vehicle).lines():
+        print(line)
 
-    plot_gantt_chart(df_filled)
+    print("\n--- Charger Occupancy Results ---")
+    for line in Charger_Checker(df_filled).lines():
+        print(line)
+
+    print("\n--- Grid Load Results ---")
+    for line in grid_load(df_filled).lines():
+        print(line)
+
+    fig = plot_gantt_chart(df_filled)
+    fig.savefig('Bus Planning Gantt Chart.png')
+    plt.show()
 
 
 if __name__ == "__main__":
@@ -2,15 +2,181 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from io import BytesIO
-from matplotlib.backends.backend_pdf import PdfPages
+import hashlib
 import os
 
-from combined8 import report_missing_data, change_data, Overlap_Checker, Energy_Checker, plot_gantt_chart, Timetable_comparison
+from combined8 import read_table, report_missing_data, change_data, sort_trips, Overlap_Checker, Continuity_Checker, Energy_Checker, Energy_Sensitivity, Charger_Checker, grid_load, plot_grid_load, plot_gantt_chart, Timetable_comparison, seconds_to_time, compute_kpis, export_pdf, Profiler, load_fleet, CHARGERS, DEFAULT_VEHICLE
 
 # Streamlit page settings
 st.set_page_config(layout="wide")
 
+# Amount of different plannings/timetables that are kept in the cache, the least recently used one is removed first
+CACHE_ENTRIES = 8
+
+
+def file_sha(data):
+    """
+    Returns the SHA-256 of the bytes of an uploaded file, used as the cache key
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def timetable_bytes():
+    """
+    Returns the bytes of the uploaded timetable, or of the local Timetable.xlsx when nothing is uploaded
+    """
+    if st.session_state.get("timetable_file") is not None:
+        return st.session_state.timetable_file.getvalue()
+    if os.path.exists("Timetable.xlsx"):
+        with open("Timetable.xlsx", "rb") as f:
+            return f.read()
+    return None
+
+
+def readable_departures(trips):
+    """
+    Replaces departure_seconds by the departure as HH:MM:SS, for a plan of more days also the service day
+    """
+    trips = trips.assign(departure=seconds_to_time(trips["departure_seconds"]).to_numpy())
+    if st.session_state.df_filled is not None and st.session_state.df_filled["service_day"].max() > 0:
+        trips = trips.assign(day=(trips["departure_seconds"] // (24 * 3600) + 1).astype(int).to_numpy())
+    return trips.drop(columns="departure_seconds")
+
+
+def plan_title(df_filled):
+    """
+    Gives the page title with the lines and the amount of service days of the processed planning
+    """
+    if df_filled is None or not len(df_filled):
+        return "Bus Planning"
+    lines = []
+    if "line" in df_filled.columns:
+        lines = sorted({str(line).removesuffix(".0") for line in df_filled["line"].dropna().unique()})
+    days = int(df_filled["service_day"].max()) + 1
+    title = "Bus Planning"
+    if lines:
+        title += (" line " if len(lines) == 1 else " lines ") + (", ".join(lines[:-1]) + " and " + lines[-1]
+                                                                 if len(lines) > 1 else lines[0])
+    return title + f" for {days} day" + ("s" if days > 1 else "")
+
+
+@st.cache_resource(max_entries=CACHE_ENTRIES, show_spinner=False)
+def analyse_planning(planning_sha, planning_name, day_boundary, chargers, vehicles_sha, simulate, profile_memory,
+                     _planning_bytes, _vehicle):
+    """
+    Reads the planning and runs change_data, the checkers and the Gantt chart once per planning
+    The result is cached on the SHA of the uploaded bytes, so a rerun with the same file is instant
+    The cached objects are shared between reruns and should not be changed
+    param planning_sha: SHA-256 of the planning bytes
+    param planning_name: the file name of the planning, used to read xlsx, csv or parquet
+    param day_boundary: the time of day in seconds where a service day starts
+    param chargers: the amount of chargers per location, None is no limit
+    param vehicles_sha: SHA-256 of the vehicle model file, None for the standard bus
+    param simulate: simulate the charging with the charge curve and the max_level ceiling in Energy_Checker
+    param profile_memory: also measure the peak memory of every step with tracemalloc
+    param _planning_bytes: the bytes of the uploaded planning (not hashed by streamlit)
+    param _vehicle: the VehicleModel or Fleet that belongs to vehicles_sha
+    return: dict with the results of every step, the error message of the steps that failed
+            and the Profiler with the time of every step
+    """
+    profiler = Profiler(memory=profile_memory)
+    result = {"df": None, "missing": None, "df_filled": None, "gantt_fig": None,
+              "overlaps": None, "continuity": None, "energy_output": None, "sensitivity": None, "chargers": None, "grid": None,
+              "grid_fig": None, "kpis": None, "errors": {},
+              "profile": profiler}
+    try:
+        with profiler.stage("read_table"):
+            result["df"] = read_table(_planning_bytes, planning_name)
+    except Exception as e:
+        result["errors"]["read"] = e
+        return result
+
+    try:
+        with profiler.stage("report_missing_data"):
+            result["missing"] = report_missing_data(result["df"])
+    except Exception as e:
+        result["errors"]["missing"] = e
+
+    try:
+        with profiler.stage("change_data"):
+            result["df_filled"] = change_data(result["df"], day_boundary=day_boundary, vehicle=_vehicle)
+    except Exception as e:
+        result["errors"]["change"] = e
+        return result
+
+    try:
+        with profiler.stage("plot_gantt_chart"):
+            fig = plot_gantt_chart(result["df_filled"])
+        # Detach the figure from pyplot, so it is freed when the cache entry is removed
+        plt.close(fig)
+        result["gantt_fig"] = fig
+    except Exception as e:
+        result["errors"]["gantt"] = e
+
+    try:
+        # Both checkers use the same sorted trips
+        with profiler.stage("sort_trips"):
+            trips = sort_trips(result["df_filled"])
+        with profiler.stage("Overlap_Checker"):
+            result["overlaps"] = Overlap_Checker(result["df_filled"], trips)
+        with profiler.stage("Continuity_Checker"):
+            result["continuity"] = Continuity_Checker(result["df_filled"], trips)
+    except Exception:
+        pass
+    try:
+        with profiler.stage("Energy_Checker"):
+            result["energy_output"] = Energy_Checker(result["df_filled"], _vehicle, simulate=simulate)
+    except Exception:
+        pass
+    try:
+        with profiler.stage("Energy_Sensitivity"):
+            result["sensitivity"] = Energy_Sensitivity(result["df_filled"], vehicle=_vehicle)
+    except Exception:
+        pass
+    try:
+        with profiler.stage("Charger_Checker"):
+            result["chargers"] = Charger_Checker(result["df_filled"], chargers)
+    except Exception:
+        pass
+    try:
+        with profiler.stage("grid_load"):
+            result["grid"] = grid_load(result["df_filled"])
+            fig = plot_grid_load(result["grid"], result["df_filled"])
+        plt.close(fig)
+        result["grid_fig"] = fig
+    except Exception as e:
+        result["errors"]["grid"] = e
+    try:
+        with profiler.stage("compute_kpis"):
+            result["kpis"] = compute_kpis(result["df_filled"], _vehicle)
+    except Exception:
+        pass
+
+    return result
+
+
+@st.cache_resource(max_entries=CACHE_ENTRIES, show_spinner=False)
+def compare_with_timetable(planning_sha, timetable_sha, tolerance, day_boundary, profile_memory, _df_filled, _timetable_bytes):
+    """
+    Runs Timetable_comparison once per combination of planning, timetable and tolerance
+    param planning_sha: SHA-256 of the planning bytes
+    param timetable_sha: SHA-256 of the timetable bytes
+    param tolerance: the allowed difference in seconds between a service trip and the timetable
+    param day_boundary: the day boundary that _df_filled was made with
+    param profile_memory: also measure the peak memory with tracemalloc
+    param _df_filled: the processed planning that belongs to planning_sha
+    param _timetable_bytes: the bytes of the timetable
+    return: (TimetableComparison with the matched, missing, unplanned and duplicated trips,
+             Profiler with the time of reading the timetable and of the comparison)
+    """
+    profiler = Profiler(memory=profile_memory)
+    with profiler.stage("read timetable"):
+        table = read_table(_timetable_bytes, "Timetable.xlsx")
+    with profiler.stage("Timetable_comparison"):
+        comparison = Timetable_comparison(_df_filled, table, tolerance=tolerance)
+    return comparison, profiler
+
+
 # Status variabelse in session state
 if "show_uploader" not in st.session_state:
     st.session_state.show_uploader = False
@@ -26,6 +192,16 @@ if "energy_output" not in st.session_state:
     st.session_state.energy_output = None
 if "overlaps" not in st.session_state:
     st.session_state.overlaps = None
+if "continuity" not in st.session_state:
+    st.session_state.continuity = None
+if "chargers" not in st.session_state:
+    st.session_state.chargers = None
+if "sensitivity" not in st.session_state:
+    st.session_state.sensitivity = None
+if "grid" not in st.session_state:
+    st.session_state.grid = None
+if "grid_fig" not in st.session_state:
+    st.session_state.grid_fig = None
 # Timetable uploader/state (required — always visible)
 if "show_timetable_uploader" not in st.session_state:
     # Make the timetable uploader visible by default (timetable is required)
@@ -34,6 +210,14 @@ if "timetable_file" not in st.session_state:
     st.session_state.timetable_file = None
 if "timetable_output" not in st.session_state:
     st.session_state.timetable_output = None
+if "planning_sha" not in st.session_state:
+    st.session_state.planning_sha = None
+if "kpis" not in st.session_state:
+    st.session_state.kpis = None
+if "profile" not in st.session_state:
+    st.session_state.profile = None
+if "timetable_profile" not in st.session_state:
+    st.session_state.timetable_profile = None
 
 # Top buttons
 # Determine if a timetable has been loaded (in session state or as a local Timetable.xlsx file)
@@ -57,15 +241,39 @@ if timetable_clicked:
 if insert_clicked:
     st.session_state.show_uploader = True
 
+# Service trips may leave a little earlier or later than the timetable
+tolerance_minutes = st.sidebar.number_input("Timetable tolerance (minutes)", min_value=0, max_value=30, value=0, step=1)
+# Activities before this hour belong to the service day before (night rides)
+day_boundary_hour = st.sidebar.number_input("Service day starts at (hour)", min_value=0, max_value=6, value=2, step=1)
+# More buses than this charging at one location at the same time is infeasible
+chargers = st.sidebar.number_input("Chargers per location (0 is no limit)", min_value=0, max_value=100,
+                                   value=CHARGERS or 0, step=1) or None
+# Battery and charger of every bus type, the standard 255 kWh bus when no file is uploaded
+vehicle_file = st.sidebar.file_uploader("Vehicle models (JSON)", type=["json"], key="vehicle_uploader")
+vehicle, vehicles_sha = DEFAULT_VEHICLE, None
+if vehicle_file is not None:
+    try:
+        vehicle, vehicles_sha = load_fleet(vehicle_file.getvalue()), file_sha(vehicle_file.getvalue())
+    except Exception as e:
+        st.sidebar.error(f"Error reading vehicle models: {e}")
+
+# Charged kWh from the charging time and a CC-CV charge curve, the battery stops at the maximum level
+simulate_charging = st.sidebar.checkbox("Simulate charging (charge curve, maximum level)", value=False)
+
+# Time (and peak memory) of every step, filled in at the end of the page
+profile_panel = st.sidebar.expander("Profiling", expanded=False)
+profile_memory = profile_panel.checkbox("Measure peak memory (tracemalloc, slower)", value=False)
+
 st.markdown("---")
 
 # Main layout for streamlit: Gantt chart and results
 main_col, result_col = st.columns([2,1])
 
 with main_col:
-    st.title("Bus Planning lines 400 and 401 for 1 day")
+    # The title is filled in after the planning is processed, it names the lines and days of the plan
+    title_slot = st.empty()
     if st.session_state.show_uploader:
-        uploaded = st.file_uploader("Choose an Excel file", type=["xlsx"], key="uploader")
+        uploaded = st.file_uploader("Choose an Excel file", type=["xlsx", "csv", "parquet"], key="uploader")
         if uploaded is not None:
             st.session_state.uploaded_file = uploaded
             import os
@@ -105,15 +313,10 @@ with main_col:
             # Run comparison immediately if a processed schedule exists
             if st.session_state.df_filled is not None:
                 try:
-                    import io, sys
-                    buf = io.StringIO()
-                    old_stdout = sys.stdout
-                    sys.stdout = buf
-                    try:
-                        Timetable_comparison(st.session_state.df_filled)
-                    finally:
-                        sys.stdout = old_stdout
-                    st.session_state.timetable_output = buf.getvalue()
+                    data = timetable_up.getvalue()
+                    st.session_state.timetable_output, st.session_state.timetable_profile = compare_with_timetable(
+                        st.session_state.planning_sha, file_sha(data), tolerance_minutes * 60, day_boundary_hour * 3600, profile_memory,
+                        st.session_state.df_filled, data)
                     st.success("Timetable comparison completed.")
                 except Exception as e:
                     st.error(f"Error running timetable comparison: {e}")
@@ -121,56 +324,74 @@ with main_col:
 
     # If the user has pressed calculate or the file has already been uploaded and calc_clicked. The processing will be done
     if calc_clicked:
-        import os
         has_timetable = st.session_state.get("timetable_file") is not None or os.path.exists("Timetable.xlsx")
         if st.session_state.uploaded_file is None:
             st.error("Upload an Excel file first using 'Insert planning'.")
         elif not has_timetable:
             st.error("Please load the timetable first using 'Load timetable' before calculating feasibility.")
         else:
-            try:
-                df = pd.read_excel(st.session_state.uploaded_file, engine="openpyxl")
-                st.session_state.df = df
-            except Exception as e:
-                st.error(f"Error reading file: {e}")
-                st.session_state.df = None
+            # All steps are cached on the SHA of the uploaded file, so an unchanged file is not processed again
+            planning_bytes = st.session_state.uploaded_file.getvalue()
+            st.session_state.planning_sha = file_sha(planning_bytes)
+            results = analyse_planning(st.session_state.planning_sha, st.session_state.uploaded_file.name,
+                                       day_boundary_hour * 3600, chargers, vehicles_sha, simulate_charging,
+                                       profile_memory, planning_bytes, vehicle)
+            errors = results["errors"]
+
+            st.session_state.df = results["df"]
+            st.session_state.df_filled = results["df_filled"]
+            st.session_state.gantt_fig = results["gantt_fig"]
+            st.session_state.overlaps = results["overlaps"]
+            st.session_state.continuity = results["continuity"]
+            st.session_state.energy_output = results["energy_output"]
+            st.session_state.chargers = results["chargers"]
+            st.session_state.sensitivity = results["sensitivity"]
+            st.session_state.grid = results["grid"]
+            st.session_state.grid_fig = results["grid_fig"]
+            st.session_state.kpis = results["kpis"]
+            st.session_state.profile = results["profile"]
+
+            if "read" in errors:
+                st.error(f"Error reading file: {errors['read']}")
 
             if st.session_state.df is not None:
                 # Chows first 5 rows data
                 st.subheader("First 5 rows of your data:")
                 st.dataframe(st.session_state.df.head())
 
-                # Chows missing data per column
-                st.subheader("Missing data per column:")
-                try:
-                    missing = report_missing_data(st.session_state.df)
-                    # Chows if you report_missing_data 
-                    try:
-                        st.write(missing.sum())
-                    except Exception:
-                        st.write(missing)
-                except Exception as e:
-                    st.error(f"Error missing data: {e}")
+                # Chows missing and invalid data, one row per problem
+                st.subheader("Data quality:")
+                if "missing" in errors:
+                    st.error(f"Error missing data: {errors['missing']}")
+                elif results["missing"].ok:
+                    st.success("No missing or invalid data found.")
+                else:
+                    st.dataframe(results["missing"].table(), hide_index=True)
 
                 # Change data to fit the model
-                try:
-                    df_filled = change_data(st.session_state.df)
-                    st.session_state.df_filled = df_filled
+                if "change" in errors:
+                    st.error(f"Error while adjusting data: {errors['change']}")
+                else:
                     st.subheader("Custom data (first 5 rows):")
-                    st.dataframe(df_filled.head())
-                except Exception as e:
-                    st.error(f"Error while adjusting data: {e}")
-                    st.session_state.df_filled = None
+                    st.dataframe(st.session_state.df_filled.head())
 
                 # Gantt chart
                 if st.session_state.df_filled is not None:
                     st.subheader("Gantt Chart:")
-                    try:
-                        fig = plot_gantt_chart(st.session_state.df_filled)
-                        if fig is None:
-                            fig = plt.gcf()
-                        st.session_state.gantt_fig = fig
-                        st.pyplot(fig)
+                    if "gantt" in errors:
+                        st.error(f"Error with drawing Gantt chart: {errors['gantt']}")
+                    else:
+                        st.pyplot(st.session_state.gantt_fig)
+
+                        # Power that all charging buses draw together from the grid
+                        st.subheader("Grid load:")
+                        if "grid" in errors:
+                            st.error(f"Error with the grid load: {errors['grid']}")
+                        elif st.session_state.grid.profile.empty:
+                            st.info("No bus charges in this plan.")
+                        else:
+                            st.pyplot(st.session_state.grid_fig)
+                            st.caption(" — ".join(st.session_state.grid.lines()))
 
                         # Bar plot: energy consumption per bus (share of total)
                         try:
@@ -209,35 +430,19 @@ with main_col:
                                 st.pyplot(fig2)
                         except Exception as e:
                             st.error(f"Error plotting per-bus energy: {e}")
-                    except Exception as e:
-                        st.error(f"Error with drawing Gantt chart: {e}")
-                        st.session_state.gantt_fig = None
-
-                    # Perform overlaps and energy checks and save the output
-                    try:
-                        st.session_state.overlaps = Overlap_Checker(st.session_state.df_filled)
-                    except Exception:
-                        st.session_state.overlaps = None
-                    try:
-                        st.session_state.energy_output = Energy_Checker(st.session_state.df_filled)
-                    except Exception:
-                        st.session_state.energy_output = None
-                    energy_output = st.session_state.get("energy_output", None)
 
                     # Run timetable comparison automatically if a timetable has been uploaded or exists locally
                     try:
-                        import os, io, sys
-                        if st.session_state.get("timetable_file") is not None or os.path.exists("Timetable.xlsx"):
-                            buf = io.StringIO()
-                            old_stdout = sys.stdout
-                            sys.stdout = buf
-                            try:
-                                Timetable_comparison(st.session_state.df_filled)
-                            finally:
-                                sys.stdout = old_stdout
-                            st.session_state.timetable_output = buf.getvalue()
+                        table_data = timetable_bytes()
+                        if table_data is not None:
+                            st.session_state.timetable_output, st.session_state.timetable_profile = compare_with_timetable(
+                                st.session_state.planning_sha, file_sha(table_data), tolerance_minutes * 60, day_boundary_hour * 3600, profile_memory,
+                                st.session_state.df_filled, table_data)
                     except Exception:
                         st.session_state.timetable_output = None
+                        st.session_state.timetable_profile = None
+
+    title_slot.title(plan_title(st.session_state.df_filled))
         
 with result_col:
     st.header("Results")
@@ -253,79 +458,73 @@ with result_col:
                 st.write(o)
         else:
             st.success("✅ No overlap was found in the planning.")
+        # Location continuity result
+        continuity = st.session_state.continuity
+        if continuity:
+            st.markdown("#### ❌ Location jumps found")
+            st.dataframe(pd.DataFrame(continuity, columns=["bus", "row", "next row", "ends at", "end time",
+                                                           "next starts at", "next start time"]), hide_index=True)
+        elif continuity is not None:
+            st.success("✅ Every bus starts each activity where the previous one ended.")
         # Energy result per bus (if available) — show per-bus status with icons
         energy_output = st.session_state.get("energy_output", None)
-        if energy_output:
+        if energy_output is not None:
             st.markdown("#### Energy result per bus")
-            try:
-                # Normalize into a list of strings
-                if isinstance(energy_output, dict):
-                    lines = [f"Bus {k}: {v}" for k, v in energy_output.items()]
-                elif isinstance(energy_output, (list, tuple, pd.Series)):
-                    lines = [str(x) for x in energy_output]
+            if energy_output.feasible:
+                st.success("✅ All buses are feasible.")
+            else:
+                st.markdown("#### ❌ Energy issues found")
+            if energy_output.simulated:
+                st.caption(f"Simulated charging: the chargers are used {energy_output.wasted_time:.1f} hours "
+                           "by buses with a full battery.")
+
+            for bid, bus in energy_output.per_bus.sort_index().iterrows():
+                if bus["feasible"]:
+                    st.markdown(f"**✅ Bus {bid}:** feasible, {bus['energy_used']:.2f} kWh used, "
+                                f"lowest battery level {bus['min_soc_percentage']:.0f}%")
                 else:
-                    try:
-                        lines = [str(x) for x in energy_output]
-                    except Exception:
-                        lines = [str(energy_output)]
-
-                import re
-                bus_status = {}
-                other_lines = []
-                for s in lines:
-                    # Try to detect "feasible" messages like "Bus plan for Bus 1 is feasible..."
-                    m1 = re.search(r"Bus plan for Bus\s*(\d+)\D.*feasible", s, flags=re.IGNORECASE)
-                    # Try to detect messages like "Bus 1: ..."
-                    m2 = re.search(r"Bus\s*(\d+):", s)
-                    if m1:
-                        bid = int(m1.group(1))
-                        bus_status[bid] = (True, s)
-                    elif m2:
-                        bid = int(m2.group(1))
-                        # If already recorded as feasible, only overwrite if this message indicates an issue
-                        is_issue = bool(re.search(r"infeasible|will drop|below", s, flags=re.IGNORECASE))
-                        if bid in bus_status:
-                            if is_issue:
-                                bus_status[bid] = (False, s)
-                        else:
-                            bus_status[bid] = (not is_issue, s)
-                    else:
-                        other_lines.append(s)
-
-                if bus_status:
-                    overall_ok = all(status for status, _ in bus_status.values())
-                    if overall_ok:
-                        st.success("✅ All buses are feasible.")
-                    else:
-                        st.markdown("#### ❌ Energy issues found")
-
-                    for bid in sorted(bus_status):
-                        status, msg = bus_status[bid]
-                        if status:
-                            st.markdown(f"**✅ Bus {bid}:** {msg}")
-                        else:
-                            st.markdown(f"**❌ Bus {bid}:** {msg}")
-
-                # Show any extra lines that couldn't be parsed per-bus
-                for l in other_lines:
-                    st.write(l)
-
-            except Exception as e:
-                st.error("Error displaying energy results: " + str(e))
+                    st.markdown(f"**❌ Bus {bid}:** battery level drops below {bus['min_level']:.0%} during route "
+                                f"{bus['first_violation'] + 1}, lowest battery level {bus['min_soc_percentage']:.0f}%")
         else:
             st.info("No energy check.")
 
+        # Charger occupancy result
+        charger_output = st.session_state.chargers
+        if charger_output is not None:
+            if charger_output.feasible:
+                st.success("✅ There are never more buses charging than chargers.")
+            else:
+                st.markdown("#### ❌ Too many buses charging at once")
+                windows = charger_output.windows.assign(
+                    start=seconds_to_time(charger_output.windows["start_seconds"]).to_numpy(),
+                    end=seconds_to_time(charger_output.windows["end_seconds"]).to_numpy())
+                st.dataframe(windows[["location", "start", "end", "chargers_in_use"]], hide_index=True)
+            if not charger_output.peak.empty:
+                st.caption("Most buses charging at once: " + ", ".join(
+                    f"{location} {peak}" for location, peak in charger_output.peak.items()))
+
         # Timetable comparison output (if available)
         timetable_out = st.session_state.get("timetable_output", None)
-        if timetable_out:
-            # Determine if timetable comparison was successful based on printed message
-            if "corresponds to the timetable" in timetable_out.lower():
-                st.success("✅ Timetable comparison: schedule matches the timetable.")
-                # still show the (short) output for context
-                st.text(timetable_out)
+        if timetable_out is not None:
+            if timetable_out.corresponds:
+                st.success(f"✅ Timetable comparison: schedule matches the timetable ({len(timetable_out.matched)} trips).")
+                deviation = timetable_out.matched["deviation_seconds"].abs()
+                if deviation.any():
+                    st.caption(f"{int((deviation > 0).sum())} trips deviate from the timetable, at most {int(deviation.max()) // 60} minutes.")
             else:
                 st.markdown("#### ❌ Timetable comparison: mismatches found")
-                st.text(timetable_out)
+                if not timetable_out.unplanned.empty:
+                    st.write("Service trips that are not in the timetable:")
+                    st.dataframe(readable_departures(timetable_out.unplanned), hide_index=True)
+                if not timetable_out.missing.empty:
+                    st.write("Timetable trips that are not driven by any bus:")
+                    st.dataframe(readable_departures(timetable_out.missing), hide_index=True)
+                if not timetable_out.duplicated.empty:
+                    st.write("Timetable trips that are driven by more than one bus:")
+                    st.dataframe(readable_departures(timetable_out.duplicated), hide_index=True)
+                if len(timetable_out.unreadable):
+                    st.write("Timetable rows with a departure time that can not be read:")
+                    st.dataframe(pd.DataFrame({"timetable_row": timetable_out.unreadable}), hide_index=True)
 
    
 
@@ -335,116 +534,77 @@ st.markdown("---")
 sum_col1, sum_col2, sum_col3, sum_col4 = st.columns([1,1,1,1])
 box_style = 'background-color:#F0F2F6; color:#111; border-radius:15px; padding:20px; text-align:center; font-weight:600; border:1px solid #ddd;'
 
-# Compute energy KPIs using the same logic as in combined8 -> ensures KPI numbers match Results
-def compute_energy_kpis(df):
-    charge_per_hour = 450
-    total_energy_used = 0.0
-    charging_energy = 0.0
-    total_charge_time = 0.0
-    total_idle_time = 0.0
-    try:
-        dfc = df.copy()
-        for _, row in dfc.iterrows():
-            ec = float(row.get('energy consumption', 0.0) or 0.0)
-            if ec > 0:
-                total_energy_used += ec
-            else:
-                charging_energy += -ec
-                total_charge_time += (-ec) / charge_per_hour
-            if row.get('activity', '') == 'idle':
-                total_idle_time += (row['end_seconds'] - row['start_seconds']) / 3600
-    except Exception:
-        pass
-    return total_energy_used, charging_energy, total_charge_time, total_idle_time
+kpis = st.session_state.get("kpis", None)
 
 with sum_col1:
-    if st.session_state.df_filled is not None:
-        try:
-            try:
-                buses_used = int(st.session_state.df_filled["bus"].nunique())
-            except Exception:
-                buses_used = len(st.session_state.df_filled["bus"].unique())
-
-            st.markdown(f'<div style="{box_style}"><b>Buses used:</b><br>{buses_used}</div>', unsafe_allow_html=True)
-        except Exception:
-            st.markdown(f'<div style="{box_style}">Buses used:<br>N/A</div>', unsafe_allow_html=True)
+    if kpis is not None:
+        st.markdown(f'<div style="{box_style}"><b>Buses used:</b><br>{kpis["buses_used"]}</div>', unsafe_allow_html=True)
     else:
         st.markdown(f'<div style="{box_style}">Buses used:<br>—</div>', unsafe_allow_html=True)
 
 with sum_col2:
-    if st.session_state.df_filled is not None:
-        try:
-            te, ce, ctime, itime = compute_energy_kpis(st.session_state.df_filled)
-            st.markdown(f'<div style="{box_style}"><b>Total energy used:</b><br>{te:.2f} kWh<br><b>Charging energy:</b><br>{ce:.2f} kWh</div>', unsafe_allow_html=True)
-        except Exception:
-            st.markdown(f'<div style="{box_style}">Total energy used:<br>N/A</div>', unsafe_allow_html=True)
+    if kpis is not None:
+        st.markdown(f'<div style="{box_style}"><b>Total energy used:</b><br>{kpis["total_energy"]:.2f} kWh<br><b>Charging energy:</b><br>{kpis["charging_energy"]:.2f} kWh</div>', unsafe_allow_html=True)
     else:
         st.markdown(f'<div style="{box_style}">Total energy used:<br>—</div>', unsafe_allow_html=True)
 
 with sum_col3:
-    if st.session_state.df_filled is not None:
-        try:
-            te, ce, ctime, itime = compute_energy_kpis(st.session_state.df_filled)
-            h = int(itime)
-            m = int(round((itime - h) * 60))
-            st.markdown(f'<div style="{box_style}"><b>Idle time:</b><br>{h}H : {m}M</div>', unsafe_allow_html=True)
-        except Exception:
-            st.markdown(f'<div style="{box_style}">Idle time:<br>N/A</div>', unsafe_allow_html=True)
+    if kpis is not None:
+        itime = kpis["idle_time"]
+        h = int(itime)
+        m = int(round((itime - h) * 60))
+        st.markdown(f'<div style="{box_style}"><b>Idle time:</b><br>{h}H : {m}M</div>', unsafe_allow_html=True)
     else:
         st.markdown(f'<div style="{box_style}">Idle time:<br>—</div>', unsafe_allow_html=True)
 
 with sum_col4:
-    if st.session_state.df_filled is not None:
-        try:
-            te, ce, ctime, itime = compute_energy_kpis(st.session_state.df_filled)
-            h = int(ctime)
-            m = int(round((ctime - h) * 60))
-            st.markdown(f'<div style="{box_style}"><b>Charging time:</b><br>{h}H : {m}M</div>', unsafe_allow_html=True)
-        except Exception:
-            st.markdown(f'<div style="{box_style}">Charging time:<br>N/A</div>', unsafe_allow_html=True)
+    if kpis is not None:
+        ctime = kpis["charging_time"]
+        h = int(ctime)
+        m = int(round((ctime - h) * 60))
+        st.markdown(f'<div style="{box_style}"><b>Charging time:</b><br>{h}H : {m}M</div>', unsafe_allow_html=True)
     else:
         st.markdown(f'<div style="{box_style}">Charging time:<br>—</div>', unsafe_allow_html=True)
 
+if kpis is not None and not kpis["per_line"].empty:
+    with st.expander("Service trips per line"):
+        st.dataframe(kpis["per_line"].rename(columns={"trips": "Trips", "hours": "Hours", "energy": "Energy (kWh)"}).round(2))
+
+# Feasible buses when the batteries wear from 255 down to 180 kWh
+sensitivity = st.session_state.get("sensitivity", None)
+if sensitivity is not None and len(sensitivity.buses):
+    with st.expander("Battery sensitivity"):
+        for line in sensitivity.lines():
+            st.write(line)
+        feasible_buses = sensitivity.per_bus().sum().rename("Feasible buses")
+        st.bar_chart(feasible_buses.set_axis(feasible_buses.index.astype(int).astype(str)))
+        st.dataframe(sensitivity.per_bus().rename(columns=lambda soh: f"{soh:g} kWh"))
+
 # Save planning: create a PDF and offer a download
 if save_clicked:
     if st.session_state.df_filled is None or st.session_state.gantt_fig is None:
         st.error("No processed schedule to save. Run 'Calculate schedule feasibility' first.")
     else:
-        buf = BytesIO()
         try:
-            with PdfPages(buf) as pdf:
-                # First page: gantt chart
-                pdf.savefig(st.session_state.gantt_fig)
-                plt.close(st.session_state.gantt_fig)
-                # Second page: overlaps and energy results
-                fig2, ax2 = plt.subplots(figsize=(8.27, 11.69))  # A4 size
-                ax2.axis("off")
-                text_lines = []
-                # Overlap
-                if st.session_state.overlaps:
-                    text_lines.append("Overlaps found:")
-                    for o in st.session_state.overlaps:
-                        text_lines.append(str(o))
-                else:
-                    text_lines.append("No overlaps found.")
-                # Energy
-                if st.session_state.energy_output:
-                    text_lines.append("")
-                    text_lines.append("Energy-checker result:")
-                    if isinstance(st.session_state.energy_output, (list, tuple)):
-                        text_lines.extend([str(x) for x in st.session_state.energy_output])
-                    else:
-                        text_lines.append(str(st.session_state.energy_output))
-                # write text to figure
-                ax2.text(0.01, 0.99, "\n".join(text_lines), va="top", wrap=True, fontsize=10)
-                pdf.savefig(fig2)
-                plt.close(fig2)
-            buf.seek(0)
+            pdf_bytes = export_pdf(st.session_state.gantt_fig, st.session_state.overlaps, st.session_state.energy_output,
+                                   st.session_state.continuity, st.session_state.chargers, st.session_state.grid_fig)
             st.success("Bus schedule saved as a PDF. Download below:")
-            st.download_button("Download BusPlanning.pdf", data=buf.getvalue(), file_name="BusPlanning.pdf", mime="application/pdf")
+            st.download_button("Download BusPlanning.pdf", data=pdf_bytes, file_name="BusPlanning.pdf", mime="application/pdf")
             # Also save to local file system
             with open("BusPlanning.pdf", "wb") as f:
-                f.write(buf.getvalue())
+                f.write(pdf_bytes)
         except Exception as e:
             st.error(f"Error saving PDF: {e}")
 
+# Profiling panel in the sidebar
+with profile_panel:
+    profiles = [p for p in (st.session_state.profile, st.session_state.timetable_profile) if p is not None]
+    if not profiles:
+        st.caption("No run yet. Click 'Calculate feasibility' to see the time of every step.")
+    else:
+        timings = pd.concat([p.table() for p in profiles], ignore_index=True)
+        if timings["peak_mb"].isna().all():
+            timings = timings.drop(columns="peak_mb")
+        st.dataframe(timings.round(3), hide_index=True)
+        st.caption(f"Total {timings['seconds'].sum():.2f} s. The times belong to the first run of this file, "
+                   "a rerun with the same file comes from the cache.")
@@ -0,0 +1,259 @@
+"""
+Generates synthetic bus plans and timetables in the same format as the Excel files of the project,
+so change_data and the checkers can be tried on plans of any size
+
+Example:
+    python generate_synthetic.py --buses 200 --headway 10 --days 7 --overlaps 3 --output-dir synthetic
+
+Every line drives between ehvbst and ehvapt, the buses start, charge and end the day at ehvgar.
+Every bus drives one slot of its line: a round trip ehvbst -> ehvapt -> ehvbst per cycle. Every few
+cycles the bus uses the layover at ehvbst to drive to ehvgar and charge, so without defects the plan
+is feasible and drives every trip of the timetable exactly once.
+"""
+import argparse
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+# Minutes after midnight of the first and the latest departure from ehvbst
+FIRST_DEPARTURE = 5 * 60 + 7
+LAST_DEPARTURE = 23 * 60 + 30
+# Driving times in minutes and the layover at ehvapt
+TO_APT = 24
+LAYOVER_APT = 6
+TO_BST = 25
+TO_GARAGE = 4
+# A cycle must leave enough time at ehvbst to drive to ehvgar, charge and drive back
+MIN_CYCLE = 95
+# Energy use in kWh, lines alternate between the consumption of line 400 and line 401
+TRIP_ENERGY = {0: (12.8496, 12.3), 1: (10.8036, 10.86)}
+GARAGE_ENERGY = 1.98
+IDLE_POWER = 5
+CHARGE_POWER = 450
+OVERNIGHT_CHARGE = 60
+# A bus charges after this many cycles, so the battery stays well above 10%
+CYCLES_PER_CHARGE = 4
+FIRST_DATE = "2025-10-31"
+
+COLUMNS = ["start location", "end location", "start time", "end time", "activity", "line",
+           "energy consumption", "bus"]
+
+
+def minutes_to_time(minutes):
+    """
+    Changes minutes after midnight to HH:MM:SS strings, times after midnight become 00:MM:SS etc.
+    """
+    minutes = pd.Series(np.asarray(minutes).astype(int) % (24 * 60))
+    return (minutes // 60).astype(str).str.zfill(2) + ":" + (minutes % 60).astype(str).str.zfill(2) + ":00"
+
+
+def line_layout(buses, headway):
+    """
+    Divides the fleet over the lines
+    return: list of (line number, amount of buses, headway in minutes)
+    """
+    per_line = math.ceil(MIN_CYCLE / headway)
+    layout = []
+    remaining = buses
+    while remaining > 0:
+        line_buses = min(per_line, remaining)
+        # A line with fewer buses gets a longer headway, so the cycle stays long enough to charge
+        line_headway = headway if line_buses == per_line else math.ceil(MIN_CYCLE / line_buses)
+        layout.append((400 + len(layout), line_buses, line_headway))
+        remaining -= line_buses
+    return layout
+
+
+def generate_day(buses, headway, rng):
+    """
+    Generates the plan of one day for the whole fleet
+    return: (plan, timetable) DataFrames with times in minutes after midnight
+    """
+    bus_ids, lines, kinds, cycle_numbers, departures, cycle_lengths = [], [], [], [], [], []
+    first_bus = 1
+    for index, (line, line_buses, line_headway) in enumerate(line_layout(buses, headway)):
+        cycle = line_buses * line_headway
+        for slot in range(line_buses):
+            starts = np.arange(FIRST_DEPARTURE + slot * line_headway, LAST_DEPARTURE + 1, cycle)
+            bus_ids.append(np.full(len(starts), first_bus + slot))
+            lines.append(np.full(len(starts), line))
+            kinds.append(np.full(len(starts), index % 2))
+            # The slot is added to the cycle number, so the buses of a line do not all charge at once
+            cycle_numbers.append(np.arange(len(starts)) + slot)
+            departures.append(starts)
+            cycle_lengths.append(np.full(len(starts), cycle))
+        first_bus += line_buses
+
+    bus = np.concatenate(bus_ids)
+    line = np.concatenate(lines)
+    kind = np.concatenate(kinds)
+    cycle_number = np.concatenate(cycle_numbers)
+    departure = np.concatenate(departures)
+    cycle = np.concatenate(cycle_lengths)
+    # The first cycle of every bus starts at the garage, the last one ends the day there
+    first = np.r_[True, bus[1:] != bus[:-1]]
+    last = np.r_[bus[1:] != bus[:-1], True]
+    every = np.ones(len(bus), dtype=bool)
+    charges = (cycle_number % CYCLES_PER_CHARGE == CYCLES_PER_CHARGE - 1) & ~last
+
+    energy_apt = np.where(kind == 0, TRIP_ENERGY[0][0], TRIP_ENERGY[1][0]) * rng.normal(1, 0.02, len(bus))
+    energy_bst = np.where(kind == 0, TRIP_ENERGY[0][1], TRIP_ENERGY[1][1]) * rng.normal(1, 0.02, len(bus))
+    arrival_apt = departure + TO_APT
+    departure_apt = arrival_apt + LAYOVER_APT
+    arrival_bst = departure_apt + TO_BST
+    next_departure = departure + cycle
+
+    # Every part of a cycle is built for all buses at once: (mask, start, end, from, to, activity, line, kWh)
+    parts = [
+        (first, departure - TO_GARAGE, departure, "ehvgar", "ehvbst", "material trip", np.nan, GARAGE_ENERGY),
+        (every, departure, arrival_apt, "ehvbst", "ehvapt", "service trip", line, energy_apt),
+        (every, arrival_apt, departure_apt, "ehvapt", "ehvapt", "idle", np.nan, None),
+        (every, departure_apt, arrival_bst, "ehvapt", "ehvbst", "service trip", line, energy_bst),
+        (~charges & ~last, arrival_bst, next_departure, "ehvbst", "ehvbst", "idle", np.nan, None),
+        (charges | last, arrival_bst, arrival_bst + TO_GARAGE, "ehvbst", "ehvgar", "material trip", np.nan, GARAGE_ENERGY),
+        (charges, arrival_bst + TO_GARAGE, next_departure - TO_GARAGE, "ehvgar", "ehvgar", "charging", np.nan, None),
+        (charges, next_departure - TO_GARAGE, next_departure, "ehvgar", "ehvbst", "material trip", np.nan, GARAGE_ENERGY),
+        (last, arrival_bst + TO_GARAGE, arrival_bst + TO_GARAGE + OVERNIGHT_CHARGE, "ehvgar", "ehvgar", "charging", np.nan, None),
+    ]
+
+    frames = []
+    for order, (mask, start, end, start_location, end_location, activity, line_number, energy) in enumerate(parts):
+        start = np.broadcast_to(start, bus.shape)[mask]
+        end = np.broadcast_to(end, bus.shape)[mask]
+        if energy is None:
+            energy = (end - start) / 60 * IDLE_POWER
+        else:
+            energy = np.broadcast_to(energy, bus.shape)[mask]
+        frames.append(pd.DataFrame({
+            "start location": start_location,
+            "end location": end_location,
+            "start": start,
+            "end": end,
+            "activity": activity,
+            "line": np.broadcast_to(line_number, bus.shape)[mask],
+            "energy consumption": energy,
+            "bus": bus[mask],
+            "order": order,
+        }))
+    plan = pd.concat(frames, ignore_index=True).sort_values(["bus", "start", "order"], kind="stable")
+
+    # A charge gives back what the bus used since the previous charge, as far as the charger allows
+    charging = (plan["activity"] == "charging").to_numpy()
+    block = np.r_[0, np.cumsum(charging)[:-1]]
+    used = plan["energy consumption"].where(~charging, 0.0).groupby([plan["bus"].to_numpy(), block]).transform("sum")
+    possible = (plan["end"] - plan["start"]) / 60 * CHARGE_POWER
+    plan.loc[charging, "energy consumption"] = -np.minimum(used[charging], possible[charging])
+
+    service = plan[plan["activity"] == "service trip"]
+    timetable = pd.DataFrame({
+        "start location": service["start location"].to_numpy(),
+        "start": service["start"].to_numpy(),
+        "end": service["end location"].to_numpy(),
+        "line": service["line"].astype(int).to_numpy(),
+    }).sort_values(["line", "start"], kind="stable")
+
+    return plan.drop(columns="order").reset_index(drop=True), timetable.reset_index(drop=True)
+
+
+def inject_defects(plan, rng, overlaps=0, soc_violations=0, missing_trips=0):
+    """
+    Adds errors to a feasible plan, so the checkers have something to find
+    param overlaps: amount of service trips that are made 10 minutes longer, into the next activity
+    param soc_violations: amount of buses that do not charge during the day
+    param missing_trips: amount of service trips that become material trips, so the timetable trip is not driven
+    """
+    plan = plan.copy()
+    service = np.flatnonzero((plan["activity"] == "service trip").to_numpy())
+
+    chosen = rng.choice(service, size=min(overlaps + missing_trips, len(service)), replace=False)
+    longer, dropped = chosen[:overlaps], chosen[overlaps:]
+    plan.loc[plan.index[longer], "end"] += 10
+
+    plan.loc[plan.index[dropped], ["activity", "line"]] = ["material trip", np.nan]
+
+    # Only the charging during the day is removed, the bus still charges at night (its last activity)
+    overnight = plan.groupby("bus")["start"].transform("max") == plan["start"]
+    daytime = (plan["activity"] == "charging") & ~overnight
+    day_buses = plan.loc[daytime, "bus"].unique()
+    empty_buses = rng.choice(day_buses, size=min(soc_violations, len(day_buses)), replace=False)
+    no_charge = daytime & plan["bus"].isin(empty_buses)
+    plan.loc[no_charge, "activity"] = "idle"
+    plan.loc[no_charge, "energy consumption"] = (plan.loc[no_charge, "end"] - plan.loc[no_charge, "start"]) / 60 * IDLE_POWER
+
+    return plan
+
+
+def generate(buses=20, headway=10, days=1, overlaps=0, soc_violations=0, missing_trips=0, seed=0):
+    """
+    Generates a bus plan and a timetable
+    param buses: the size of the fleet
+    param headway: minutes between two departures of a line in the same direction
+    param days: amount of service days, with more than one day both frames get a 'date' column
+    param overlaps, soc_violations, missing_trips: amount of defects per day, see inject_defects
+    param seed: seed of the random generator
+    return: (plan, timetable) in the format of the Excel files ('start time' as HH:MM:SS and HH:MM)
+    """
+    rng = np.random.default_rng(seed)
+    plans, timetables = [], []
+    for day in range(days):
+        plan, timetable = generate_day(buses, headway, rng)
+        plan = inject_defects(plan, rng, overlaps, soc_violations, missing_trips)
+
+        plan["start time"] = minutes_to_time(plan["start"]).to_numpy()
+        plan["end time"] = minutes_to_time(plan["end"]).to_numpy()
+        timetable["start time"] = minutes_to_time(timetable["start"]).str[:5].to_numpy()
+        plan = plan[COLUMNS]
+        timetable = timetable[["start location", "start time", "end", "line"]]
+        if days > 1:
+            date = (pd.Timestamp(FIRST_DATE) + pd.Timedelta(days=day)).strftime("%Y-%m-%d")
+            plan = plan.assign(date=date)
+            timetable = timetable.assign(date=date)
+        plans.append(plan)
+        timetables.append(timetable)
+
+    return pd.concat(plans, ignore_index=True), pd.concat(timetables, ignore_index=True)
+
+
+def write(df, path):
+    """
+    Writes a DataFrame as xlsx, csv or parquet, depending on the extension of path
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        df.to_csv(path, index=False)
+    elif extension == ".parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_excel(path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic bus plan and timetable.")
+    parser.add_argument("--buses", type=int, default=20, help="size of the fleet")
+    parser.add_argument("--headway", type=int, default=10, help="minutes between departures of a line")
+    parser.add_argument("--days", type=int, default=1, help="amount of service days")
+    parser.add_argument("--overlaps", type=int, default=0, help="overlapping trips per day")
+    parser.add_argument("--soc-violations", type=int, default=0, help="buses per day that do not charge")
+    parser.add_argument("--missing-trips", type=int, default=0, help="timetable trips per day that are not driven")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=["xlsx", "csv", "parquet"], default="xlsx")
+    parser.add_argument("--output-dir", default=".")
+    args = parser.parse_args(argv)
+
+    plan, timetable = generate(args.buses, args.headway, args.days, args.overlaps,
+                               args.soc_violations, args.missing_trips, args.seed)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    name = f"{args.buses} buses {args.days} days"
+    plan_path = os.path.join(args.output_dir, f"Synthetic Bus Planning {name}.{args.format}")
+    timetable_path = os.path.join(args.output_dir, f"Synthetic Timetable {name}.{args.format}")
+    write(plan, plan_path)
+    write(timetable, timetable_path)
+    print(f"{len(plan)} activities written to {plan_path}")
+    print(f"{len(timetable)} timetable trips written to {timetable_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -68,15 +68,14 @@ with main_col:
                 st.subheader("First 5 rows of your data:")
                 st.dataframe(st.session_state.df.head())
 
-                # Chows missing data per column
-                st.subheader("Missing data per column:")
+                # Chows missing and invalid data, one row per problem
+                st.subheader("Data quality:")
                 try:
                     missing = report_missing_data(st.session_state.df)
-                    # Chows if you report_missing_data 
-                    try:
-                        st.write(missing.sum())
-                    except Exception:
-                        st.write(missing)
+                    if missing.ok:
+                        st.success("No missing or invalid data found.")
+                    else:
+                        st.dataframe(missing.table(), hide_index=True)
                 except Exception as e:
                     st.error(f"Error missing data: {e}")
 
@@ -133,26 +132,11 @@ with result_col:
             st.success("✅ No overlap was found in the planning.")
         # Energy result per bus (if available)
         energy_output = st.session_state.get("energy_output", None)
-        if energy_output:
+        if energy_output is not None:
             st.markdown("#### Energy result per bus")
-            try:
-                # Common iterable results make to a string per line
-                if isinstance(energy_output, (list, tuple, pd.Series)):
-                    for line in energy_output:
-                        st.write(str(line))
-                # Dict-like results
-                elif isinstance(energy_output, dict):
-                    for k, v in energy_output.items():
-                        st.write("Bus " + str(k) + ": " + str(v))
-                # Display if not iterable
-                else:
-                    try:
-                        for line in energy_output:
-                            st.write(str(line))
-                    except Exception:
-                        st.write(str(energy_output))
-            except Exception as e:
-                st.error("Error displaying energy results: " + str(e))
+            # EnergyResult gives one readable line per bus
+            for line in energy_output.lines():
+                st.write(line)
         else:
             st.info("No energie-check.")
     st.markdown("</div>", unsafe_allow_html=True)
@@ -237,13 +221,10 @@ if save_clicked:
                 else:
                     text_lines.append("No overlaps found.")
                 # Energy
-                if st.session_state.energy_output:
+                if st.session_state.energy_output is not None:
                     text_lines.append("")
                     text_lines.append("Energie-checker result:")
-                    if isinstance(st.session_state.energy_output, (list, tuple)):
-                        text_lines.extend([str(x) for x in st.session_state.energy_output])
-                    else:
-                        text_lines.append(str(st.session_state.energy_output))
+                    text_lines.extend(st.session_state.energy_output.lines())
                 # write text to figure
                 ax2.text(0.01, 0.99, "\n".join(text_lines), va="top", wrap=True, fontsize=10)
                 pdf.savefig(fig2)
@@ -0,0 +1,190 @@
+"""
+Validates many bus plans against one timetable without any input() prompts
+
+Example:
+    python validate_plans.py "Bus Planning*.xlsx" --timetable "Timetable.xlsx" --report report.json
+
+Every plan is checked on overlaps, location continuity, energy, chargers and the timetable in a separate process.
+The exit code is 0 if every plan is feasible and 1 otherwise.
+With --profile the time of every step is printed per plan and stored in the report.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from combined8 import (read_table, report_missing_data, change_data, sort_trips, Overlap_Checker,
+                       Continuity_Checker, Timetable_comparison, Energy_Checker, Energy_Sensitivity, Charger_Checker,
+                       grid_load, compute_kpis,
+                       Profiler, profile_lines, load_fleet, DAY_BOUNDARY, CHARGERS, DEFAULT_VEHICLE)
+
+
+def validate_plan(plan_path, table, tolerance=0, profile=None, day_boundary=DAY_BOUNDARY, chargers=CHARGERS,
+                  vehicle=DEFAULT_VEHICLE, sensitivity=False, simulate=False):
+    """
+    Runs all checks on one plan
+    param plan_path: the path of the plan (xlsx, csv or parquet)
+    param table: the timetable DataFrame
+    param tolerance: the allowed difference in seconds between a service trip and the timetable
+    param profile: None, "time" or "memory", stores the time (and peak memory) of every step in 'profile'
+    param day_boundary: the time of day in seconds where a service day starts
+    param chargers: the amount of chargers per location, None is no limit
+    param vehicle: the VehicleModel or Fleet with the battery and charger of every bus
+    param sensitivity: also store the amount of feasible buses for every battery size of SENSITIVITY_SOH
+    param simulate: check the energy with the simulated charging (charge curve and max_level ceiling)
+    return: dict with the KPIs and violations of the plan, 'error' is set if the plan could not be checked
+    """
+    report = {"plan": plan_path, "feasible": False, "error": None}
+    profiler = Profiler(memory=profile == "memory")
+    if profile:
+        report["profile"] = profiler.records
+    try:
+        with profiler.stage("read_table"):
+            df = read_table(plan_path)
+        with profiler.stage("report_missing_data"):
+            quality = report_missing_data(df)
+        with profiler.stage("change_data"):
+            df_filled = change_data(df, day_boundary=day_boundary, vehicle=vehicle)
+        with profiler.stage("sort_trips"):
+            trips = sort_trips(df_filled)
+        with profiler.stage("Overlap_Checker"):
+            overlaps = Overlap_Checker(df_filled, trips)
+        with profiler.stage("Continuity_Checker"):
+            jumps = Continuity_Checker(df_filled, trips)
+        with profiler.stage("Energy_Checker"):
+            energy = Energy_Checker(df_filled, vehicle, simulate=simulate)
+        with profiler.stage("Charger_Checker"):
+            charging = Charger_Checker(df_filled, chargers)
+        with profiler.stage("grid_load"):
+            grid = grid_load(df_filled)
+        with profiler.stage("Timetable_comparison"):
+            comparison = Timetable_comparison(df_filled, table, tolerance=tolerance)
+        with profiler.stage("compute_kpis"):
+            kpis = compute_kpis(df_filled, vehicle)
+        if sensitivity:
+            with profiler.stage("Energy_Sensitivity"):
+                sweep = Energy_Sensitivity(df_filled, vehicle=vehicle)
+    except Exception as e:
+        report["error"] = f"{type(e).__name__}: {e}"
+        return report
+
+    infeasible = energy.per_bus[~energy.per_bus["feasible"]]
+    if simulate:
+        report["wasted_charger_time"] = round(float(energy.wasted_time), 2)
+    if sensitivity:
+        feasible_soh = sweep.soh[sweep.feasible.all(axis=0)[:, 0, 0]]
+        report["lowest_feasible_soh"] = float(feasible_soh.min()) if len(feasible_soh) else None
+        report["feasible_buses_per_soh"] = {f"{soh:g}": int(count) for soh, count
+                                            in zip(sweep.soh, sweep.feasible.sum(axis=0)[:, 0, 0])}
+    report.update({
+        "feasible": (not overlaps and not jumps and energy.feasible and charging.feasible
+                     and comparison.corresponds),
+        "buses_used": int(kpis["buses_used"]),
+        "total_energy": round(float(kpis["total_energy"]), 2),
+        "charging_energy": round(float(kpis["charging_energy"]), 2),
+        "charging_time": round(float(kpis["charging_time"]), 2),
+        "idle_time": round(float(kpis["idle_time"]), 2),
+        "peak_grid_load": round(grid.peak_kw, 1),
+        "charging_energy_per_tariff": {name: round(float(energy), 2) for name, energy in grid.per_tariff.items()},
+        "rows_with_missing_data": (quality.missing_rows + 2).tolist(),
+        "unparsable_times": (quality.unparsable_times + 2).tolist(),
+        "unknown_activities": (quality.unknown_activities + 2).tolist(),
+        "unknown_locations": (quality.unknown_locations + 2).tolist(),
+        "negative_durations": (quality.negative_durations + 2).tolist(),
+        "overlaps": [[str(o[0]), int(o[1]), int(o[2])] for o in overlaps],
+        "location_jumps": [[str(j[0]), int(j[1]), int(j[2])] for j in jumps],
+        "energy_violations": [[str(bus), int(row)] for bus, row in infeasible["first_violation"].items()],
+        "peak_chargers": {location: int(peak) for location, peak in charging.peak.items()},
+        "charger_windows": [[location, int(start), int(end), int(in_use)] for location, start, end, in_use
+                            in charging.windows.itertuples(index=False)],
+        "unplanned_trips": comparison.unplanned["plan_row"].tolist(),
+        "missing_trips": comparison.missing["timetable_row"].tolist(),
+        "duplicated_trips": comparison.duplicated["timetable_row"].tolist(),
+        "unreadable_departures": comparison.unreadable.tolist(),
+    })
+    return report
+
+
+def write_report(reports, path):
+    """
+    Writes the reports to a JSON file, or to a CSV file with one row per plan if path ends with .csv
+    """
+    if path.lower().endswith(".csv"):
+        rows = pd.DataFrame(reports)
+        for column in rows.columns:
+            if rows[column].map(lambda value: isinstance(value, (list, dict))).any():
+                rows[column] = rows[column].map(
+                    lambda value: json.dumps(value) if isinstance(value, (list, dict)) else value)
+        rows.to_csv(path, index=False)
+    else:
+        with open(path, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate bus plans against a timetable.")
+    parser.add_argument("plans", nargs="+", help="plan files or glob patterns, for example 'Bus Planning*.xlsx'")
+    parser.add_argument("--timetable", required=True, help="the timetable file")
+    parser.add_argument("--report", default="validation_report.json", help="output file, .json or .csv")
+    parser.add_argument("--workers", type=int, default=None, help="amount of processes (default: all cores)")
+    parser.add_argument("--tolerance", type=int, default=0, help="allowed timetable deviation in minutes")
+    parser.add_argument("--day-boundary", type=float, default=DAY_BOUNDARY / 3600,
+                        help="hour where a service day starts, earlier activities are night rides of the day before")
+    parser.add_argument("--vehicles", help="JSON file with the vehicle models (default: the standard 255 kWh bus)")
+    parser.add_argument("--chargers", type=int, default=CHARGERS, help="amount of chargers per location (default: no limit)")
+    parser.add_argument("--simulate", action="store_true",
+                        help="simulate the charging with a CC-CV charge curve and the maximum battery level")
+    parser.add_argument("--sensitivity", action="store_true",
+                        help="also check every battery size from 255 down to 180 kWh")
+    parser.add_argument("--profile", nargs="?", const="time", choices=["time", "memory"],
+                        help="print the time of every step, 'memory' also measures the peak memory (slower)")
+    args = parser.parse_args(argv)
+
+    plan_paths = sorted({path for pattern in args.plans for path in glob.glob(pattern)})
+    plan_paths = [path for path in plan_paths if os.path.abspath(path) != os.path.abspath(args.timetable)]
+    if not plan_paths:
+        print("No plans found.", file=sys.stderr)
+        return 2
+
+    table = read_table(args.timetable)
+    vehicle = load_fleet(args.vehicles) if args.vehicles else DEFAULT_VEHICLE
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        reports = list(pool.map(validate_plan, plan_paths, [table] * len(plan_paths),
+                                [args.tolerance * 60] * len(plan_paths), [args.profile] * len(plan_paths),
+                                [round(args.day_boundary * 3600)] * len(plan_paths), [args.chargers] * len(plan_paths),
+                                [vehicle] * len(plan_paths), [args.sensitivity] * len(plan_paths),
+                                [args.simulate] * len(plan_paths)))
+
+    write_report(reports, args.report)
+
+    for report in reports:
+        if report["error"]:
+            status = f"ERROR ({report['error']})"
+        elif report["feasible"]:
+            status = "feasible"
+        else:
+            status = (f"infeasible ({len(report['overlaps'])} overlaps, {len(report['location_jumps'])} location jumps, "
+                      f"{len(report['energy_violations'])} energy violations, "
+                      f"{len(report['charger_windows'])} charger shortages, "
+                      f"{len(report['unplanned_trips']) + len(report['missing_trips']) + len(report['duplicated_trips'])} timetable mismatches, "
+                      f"{len(report['unreadable_departures'])} unreadable departures)")
+        print(f"{report['plan']}: {status}")
+        if args.sensitivity and not report["error"]:
+            lowest = report["lowest_feasible_soh"]
+            print(f"    energy feasible down to {lowest:g} kWh" if lowest is not None
+                  else "    not energy feasible for any battery size of the sweep")
+        if args.profile:
+            for line in profile_lines(report["profile"]):
+                print(f"    {line}")
+    print(f"Report written to {args.report}")
+
+    return 0 if all(report["feasible"] for report in reports) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())